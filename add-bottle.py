@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
 
-# This script adds a new bottle to the cellar, leaving it unpositioned. Along
-# the way, it may also create new regions, varietals, blends, etc.
+# This script adds a new bottle to the cellar, and gives it a position right
+# away (see LayoutService). Along the way, it may also create new regions,
+# varietals, blends, etc.
 
 # --------------------------------------------------------------------------------
 
@@ -12,6 +13,7 @@ from operator import attrgetter
 
 from backend.raw import db
 from backend.repository import Repository
+from backend.layoutService import LayoutService
 from scripts.styling import stylize
 from scripts.fuzzyMatchTextEntry import textEntry
 from scripts.confirm import confirmAndCommit
@@ -172,22 +174,38 @@ def addBottles(repo, label):
 		else:
 			holdYears[year] = num
 
+	bottles = []
 	for holdYear in sorted(holdYears):
 		holdAmt = holdYears[holdYear]
 
 		for i in range(0, holdAmt):
-			repo.addBottle(cost, acquisition, holdYear, label)
+			bottles.append(repo.addBottle(cost, acquisition, holdYear, label))
+
+	return bottles
 
 # --------------------------------------------------------------------------------
 
 repo = Repository()
-winery = getWinery(repo)
-print()
 
-label = getLabel(repo, winery)
-print()
+# Nothing is written before the changes are confirmed, so that the database is
+# not locked while waiting on input. The new objects get their ids (and a new
+# label its stored aggregates) when committed.
+with db.session.no_autoflush:
+	winery = getWinery(repo)
+	print()
+
+	label = getLabel(repo, winery)
+	print()
+
+	bottles = addBottles(repo, label)
+	print()
+
+	layout = LayoutService(repo.logger)
+	if len(layout.unstoredRacks) > 0:
+		print(stylize(Fore.YELLOW, 'No layout bins are stored for %s, run defrag.py to store them' % ', '.join(layout.unstoredRacks)))
+		print()
 
-addBottles(repo, label)
-print()
+	for bottle in bottles:
+		layout.place(bottle)
 
 confirmAndCommit(db, repo.logger)
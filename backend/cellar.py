@@ -1,14 +1,127 @@
 #!/usr/bin/env python3
 
-from .raw.data_model import Label, Bottle, Region, Varietal
+from .raw.data_model import Winery, Label, Bottle, Region, Varietal, Blend
 from .raw import db
+from .raw.load_profiles import LoadProfile
+from .raw.schema import requireCurrentSchema
+from .raw.inventory import InventoryByYear, cacheInventory
 from .databaseLogger import DatabaseLogger
-from .dividoLayout import DividoLayout
+from .cellarLayout import CellarLayout
+from .layoutService import LayoutService
+from .cellarGeometry import cellarGeometry
+from .defragPlanner import DefragPlanner
 
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, case, cast
+from sqlalchemy import Integer, select
 from datetime import date
 
 import math
+import numpy
+
+# The percentiles reported for each year of a simulated consumption projection
+SimulationPercentiles = (10, 50, 90)
+
+# The most simulated trajectories a projection may ask for. The simulation
+# holds (simulations x years x 12) months of draws at once.
+MaxSimulations = 10000
+
+# --------------------------------------------------------------------------------
+
+class MonthlyConsumption:
+	"""This represents the bottles consumed in a single month. The count and
+	total cost are filled in up front, while the bottles themselves are loaded
+	the first time they are used. Iterating this object, or taking its length,
+	behaves as though it were the list of bottles.
+	"""
+
+	def __init__(self, year, month):
+		"""Build an (initially empty) month of consumption"""
+
+		self.year = year
+		self.month = month
+		self.count = 0
+		self.cost = 0
+		self._bottles = None
+
+	@property
+	def bottles(self):
+		"""The bottles consumed this month, in order of consumption"""
+
+		if self._bottles is None:
+			start = date(self.year, self.month, 1)
+			end = date(self.year + 1, 1, 1) if self.month == 12 else date(self.year, self.month + 1, 1)
+
+			q = db.session.query(Bottle) \
+			              .filter(Bottle.consumption >= start) \
+			              .filter(Bottle.consumption < end) \
+			              .order_by(Bottle.consumption) \
+			              .options(*LoadProfile.bottleLabels())
+			self._bottles = q.all()
+
+		return self._bottles
+
+	def __len__(self):
+		return self.count
+
+	def __iter__(self):
+		return iter(self.bottles)
+
+# --------------------------------------------------------------------------------
+
+class SnapshotBottles:
+	"""This represents a group of bottles found in a CellarSnapshot, by their
+	ids. Only the ids are kept up front; the bottles themselves are loaded, in
+	the order of their ids, the first time they are used. Iterating this
+	object, indexing it, or taking its length, behaves as though it were the
+	list of bottles.
+	"""
+
+	# The most ids bound to a single query, well within SQLite's limit
+	MaxIdsPerQuery = 500
+
+	def __init__(self, ids):
+		"""Build the group from an array of bottle ids"""
+
+		self.ids = ids
+		self._bottles = None
+
+	@property
+	def bottles(self):
+		"""The bottles of the group, in the order of their ids"""
+
+		if self._bottles is None:
+			ids = [int(id) for id in self.ids]
+			bottlesById = {}
+
+			for start in range(0, len(ids), self.MaxIdsPerQuery):
+				q = db.session.query(Bottle).filter(Bottle.id.in_(ids[start:start + self.MaxIdsPerQuery])) \
+				              .options(*LoadProfile.bottleDetails())
+				bottlesById.update((bottle.id, bottle) for bottle in q)
+
+			self._bottles = [bottlesById[id] for id in ids]
+
+		return self._bottles
+
+	def __len__(self):
+		return len(self.ids)
+
+	def __iter__(self):
+		return iter(self.bottles)
+
+	def __getitem__(self, idx):
+		return self.bottles[idx]
+
+	@classmethod
+	def join(cls, groups):
+		"""This combines several groups into one, still without loading any
+		bottles. Lists of bottles (as built without a snapshot) are joined into
+		a single list.
+		"""
+
+		if len(groups) > 0 and all(isinstance(group, cls) for group in groups):
+			return cls(numpy.concatenate([group.ids for group in groups]))
+
+		return [bottle for group in groups for bottle in group]
 
 # --------------------------------------------------------------------------------
 
@@ -19,20 +132,82 @@ class Cellar:
 
 	logger = DatabaseLogger()
 
+	def __init__(self, snapshot=None):
+		"""Refuse to operate on a database that has not been migrated to the
+		schema version this code expects. If a CellarSnapshot is supplied, the
+		aggregate reports are computed from it, rather than from ORM objects.
+		"""
+
+		requireCurrentSchema()
+		self.snapshot = snapshot
+		self._layoutService = None
+
 	@property
 	def labels(self):
 		"""The returns all wine labels that currently have at least one bottle
 		in the cellar.
 		"""
 
-		q = db.session.query(Label).join(Bottle).filter(Bottle.consumption == None)
+		q = db.session.query(Label).join(Bottle).filter(Bottle.consumption == None) \
+		              .options(*LoadProfile.labelInventory())
 		return q.all()
 
+	def labelValues(self):
+		"""This returns the labels with at least one bottle in the cellar as
+		dictionaries (see TableBase.value), boldest first, each with its
+		description, varietal description and region description. The labels
+		are read with two Core queries and converted by the label row
+		serializer, without creating any ORM objects.
+		"""
+
+		serialize = Label.rowSerializer()
+		connection = db.session.connection()
+
+		q = select(Label.__table__, Winery.name.label('wineryName'), Region.name.label('regionName'), Region.country) \
+			.join_from(Label, Winery, Label.winery_id == Winery.id).join(Region, Winery.region_id == Region.id) \
+			.filter(Label.num_stored > 0) \
+			.order_by(Label.weighted_boldness.desc(), Label.id)
+
+		labels = []
+		for row in connection.execute(q):
+			label = serialize(row)
+			label.update({
+				'description': Label.describe(label['vintage'], row.wineryName, label['name']),
+				'regionDescription': Region.describe(row.regionName, row.country)
+			})
+			labels.append(label)
+
+		q = select(Blend.label_id, Blend.portion, Varietal.name) \
+			.join_from(Blend, Varietal, Blend.varietal_id == Varietal.id).join(Label, Blend.label_id == Label.id) \
+			.filter(Label.num_stored > 0) \
+			.order_by(Blend.id)
+
+		blends = {}
+		for labelId, portion, varietalName in connection.execute(q):
+			blends.setdefault(labelId, []).append((portion, varietalName))
+
+		for label in labels:
+			label['varietalDescription'] = Label.describeVarietals(blends.get(label['id'], []))
+
+		return labels
+
 	@property
 	def bottles(self):
-		"""The returns all bottles in the cellar"""
+		"""The returns all bottles in the cellar, in the order they were added"""
 
-		q = db.session.query(Bottle).filter(Bottle.consumption == None)
+		q = db.session.query(Bottle).filter(Bottle.consumption == None).order_by(Bottle.id) \
+		              .options(*LoadProfile.bottleDetails())
+		return q.all()
+
+	@property
+	def unpositionedBottles(self):
+		"""This returns the bottles in the cellar without a position, in the
+		order they were added.
+		"""
+
+		q = db.session.query(Bottle).filter(Bottle.consumption == None).filter(Bottle.boldness_coord == None) \
+		              .order_by(Bottle.id) \
+		              .options(*LoadProfile.bottleDetails())
 		return q.all()
 
 	@property
@@ -44,6 +219,9 @@ class Cellar:
 		current year will be considered to be the current year (i.e., "Drink
 		Now").  """
 
+		if self.snapshot is not None:
+			return self._bottlesByYearFromSnapshot()
+
 		currentYear = date.today().year
 		inventory = {}
 
@@ -74,8 +252,11 @@ class Cellar:
 
 	def consumptionByMonth(self):
 		"""This computes a count of bottle consumption to date. The returned
-		object is indexed first by year, then by month, and returns a count of
-		consumed bottles. Months are 1-based
+		object is indexed first by year, then by month, and returns a
+		MonthlyConsumption with the count and total (inflated) cost of consumed
+		bottles. Months are 1-based. The counts and costs are computed by a
+		single grouped query; the bottles themselves are only loaded for the
+		months where they are asked for.
 		"""
 
 		q = db.session.query(func.min(Bottle.consumption))
@@ -84,31 +265,51 @@ class Cellar:
 		currentYear = date.today().year
 		currentMonth = date.today().month
 		consumption = {
-			first.year: {n: [] for n in range(first.month, 13)},
-			currentYear: {n: [] for n in range(1, currentMonth + 1)}
+			first.year: {n: MonthlyConsumption(first.year, n) for n in range(first.month, 13)},
+			currentYear: {n: MonthlyConsumption(currentYear, n) for n in range(1, currentMonth + 1)}
 		}
 
-		q = db.session.query(Bottle).filter(Bottle.consumption != None).order_by(Bottle.consumption)
-		for bottle in q.all():
-			year = bottle.consumption.year
-			month = bottle.consumption.month
+		year = cast(func.strftime('%Y', Bottle.consumption), Integer)
+		month = cast(func.strftime('%m', Bottle.consumption), Integer)
+		q = db.session.query(year, month, func.count(Bottle.id), func.sum(func.inflated_cost(Bottle.cost, Bottle.acquisition))) \
+		              .filter(Bottle.consumption != None) \
+		              .group_by(year, month)
 
+		for year, month, count, cost in q.all():
 			if year not in consumption:
-				consumption[year] = {n: [] for n in range(1, 13)}
+				consumption[year] = {n: MonthlyConsumption(year, n) for n in range(1, 13)}
 
-			consumption[year][month].append(bottle)
+			consumption[year][month].count = count
+			consumption[year][month].cost = cost
 
 		return consumption
 
-	def consumptionProjection(self):
+	def consumptionProjection(self, simulations=None):
 		"""This computes a projection of the cellar bottles over time. The
 		resulting dictionary object contains an entry for the average annual
 		consumption, the averaged consumed bottle's cost, the total stored
 		bottle count / value, and the number to be consumed each year (including
 		excess / shortage amounts). This is useful for visualizing the cellar
 		contents over time.
+
+		If a number of simulations is supplied, each year additionally gets a
+		'simulated' entry, from that many randomly sampled consumption
+		trajectories (see _simulateExcess). At most MaxSimulations are run.
 		"""
 
+		if self.snapshot is not None:
+			projection = self._consumptionProjectionFromSnapshot()
+		else:
+			projection = self._consumptionProjectionFromDatabase()
+
+		if simulations:
+			self._simulateExcess(projection['byYear'], self._monthlyConsumptionHistory(), min(simulations, MaxSimulations))
+
+		return projection
+
+	def _consumptionProjectionFromDatabase(self):
+		"""The database form of consumptionProjection"""
+
 		q = db.session.query(
 			func.count(Bottle.consumption),
 			func.min(Bottle.consumption))
@@ -133,7 +334,7 @@ class Cellar:
 
 		createYears(currentYear)
 
-		q = db.session.query(Bottle)
+		q = db.session.query(Bottle).options(*LoadProfile.bare())
 		for bottle in q:
 			if bottle.consumption is None:
 				valueStored += bottle.inflatedCost
@@ -164,42 +365,168 @@ class Cellar:
 			'byYear': aggregated
 		}
 
-	def byRegion(self):
-		"""This returns a list of all bottles in the cellar, organized by
+	def _monthlyConsumptionHistory(self):
+		"""This returns an array with the number of bottles consumed in each
+		complete month, from the month of the first consumption up to (but not
+		including) the current month. Months without any consumption are
+		included as zeros.
+		"""
+
+		now = date.today()
+		currentMonth = now.year * 12 + now.month - 1
+
+		if self.snapshot is not None:
+			consumed = self.snapshot.bottleConsumed
+			months = self.snapshot.bottleConsumptionYears[consumed] * 12 + self.snapshot.bottleConsumptionMonths[consumed] - 1
+			counts = numpy.ones(len(months))
+		else:
+			byMonth = [(year * 12 + month - 1, consumption.count)
+			           for year, months in self.consumptionByMonth().items()
+			           for month, consumption in months.items()
+			           if consumption.count > 0]
+			months = numpy.array([month for month, count in byMonth], dtype=int)
+			counts = numpy.array([count for month, count in byMonth])
+
+		if len(months) == 0:
+			return numpy.zeros(0, dtype=int)
+
+		first = int(months.min())
+		complete = months < currentMonth
+		history = numpy.bincount(months[complete] - first, weights=counts[complete], minlength=max(0, currentMonth - first))
+		return history.astype(int)
+
+	def _simulateExcess(self, byYear, history, simulations):
+		"""This runs a Monte Carlo version of the consumption projection. Each
+		trajectory draws the consumption of every remaining month independently
+		from the historical monthly counts (a bootstrap), then carries excess
+		bottles forward year by year exactly as the flat projection does. All
+		trajectories are computed at once, as arrays of (simulations x years).
+
+		Each year of byYear receives a 'simulated' entry, with the excess at each
+		of the SimulationPercentiles (negative values are shortfalls) and the
+		fraction of trajectories that come up short in that year.
+		"""
+
+		if len(history) == 0:
+			return
+
+		now = date.today()
+		years = sorted(byYear)
+		numYears = len(years)
+
+		# The months already past this year are not consumed again, and the
+		# current month only counts for the portion still remaining
+		monthWeights = numpy.ones(numYears * 12)
+		monthWeights[0:now.month - 1] = 0
+		monthStart = date(now.year, now.month, 1)
+		monthEnd = date(now.year + 1, 1, 1) if now.month == 12 else date(now.year, now.month + 1, 1)
+		monthWeights[now.month - 1] = (monthEnd - now).days / (monthEnd - monthStart).days
+
+		rng = numpy.random.default_rng()
+		samples = rng.choice(history, size=(simulations, numYears * 12))
+		consumption = numpy.rint((samples * monthWeights).reshape(simulations, numYears, 12).sum(axis=2))
+
+		counts = numpy.array([byYear[year]['count'] for year in years])
+		excess = numpy.empty((simulations, numYears))
+		carryover = numpy.zeros(simulations)
+		for n in range(numYears):
+			excess[:, n] = counts[n] + carryover - consumption[:, n]
+			carryover = numpy.maximum(0, excess[:, n])
+
+		bands = numpy.percentile(excess, SimulationPercentiles, axis=0)
+		shortfallChance = (excess < 0).mean(axis=0)
+
+		for n, year in enumerate(years):
+			byYear[year]['simulated'] = {
+				'excess': {percentile: float(band[n]) for percentile, band in zip(SimulationPercentiles, bands)},
+				'shortfallChance': float(shortfallChance[n])
+			}
+
+	def inventoryByYear(self):
+		"""This counts the bottles in the cellar for every label, by hold year,
+		and rolls the counts up to wineries and regions (see InventoryByYear).
+		It is done with a single grouped query, or a single pass over the
+		snapshot. The result is kept in the session, so that the inventoryByYear
+		methods of labels and regions use it until the bottles change.
+		"""
+
+		if self.snapshot is not None:
+			inventory = self._inventoryByYearFromSnapshot()
+
+		else:
+			currentYear = date.today().year
+			holdYear = func.max(Bottle.hold_until, currentYear)
+
+			q = db.session.query(Label.id, Winery.id, Winery.region_id, holdYear, func.count(Bottle.id)) \
+			              .select_from(Bottle).join(Bottle.label).join(Label.winery) \
+			              .filter(Bottle.consumption == None) \
+			              .group_by(Label.id, holdYear)
+
+			inventory = InventoryByYear(currentYear, q.all())
+
+		cacheInventory(db.session, inventory)
+		return inventory
+
+	def byRegion(self, withBottles=False):
+		"""This returns a count of all bottles in the cellar, organized by
 		region. The returned list contains data for each country in descending
 		order of bottle counts. Each country object contains a similar array of
-		regions.
+		regions, and each region includes its inventory by hold year (see
+		Region.inventoryByYear). The counts come from inventoryByYear.
+		If withBottles is set, the bottles themselves are also included for
+		each country and region.
 		"""
 
-		regionBottles = {}
-		countryBottles = {}
+		if self.snapshot is not None:
+			return self._byRegionFromSnapshot(withBottles)
 
-		q = db.session.query(Region)
-		for region in q.all():
-			country = region.country
-			if country not in regionBottles:
-				regionBottles[country] = {}
-				countryBottles[country] = []
+		inventory = self.inventoryByYear().byRegion
 
-			regionBottles[country][region] = []
-			countryBottles[country] = []
+		regionBottles = None
+		if withBottles:
+			regionBottles = {}
+			q = db.session.query(Bottle).filter(Bottle.consumption == None).order_by(Bottle.id) \
+			              .options(*LoadProfile.bottleLabels())
+			for bottle in q.all():
+				regionBottles.setdefault(bottle.label.winery.region_id, []).append(bottle)
 
-		q = db.session.query(Bottle).filter(Bottle.consumption == None)
-		for bottle in q.all():
-			region = bottle.label.winery.region
-			country = region.country
+		return self._regionRanking(inventory, regionBottles)
 
-			regionBottles[country][region].append(bottle)
-			countryBottles[country].append(bottle)
+	def _regionRanking(self, inventory, regionBottles):
+		"""This arranges the per-region inventories computed by byRegion into
+		countries and regions, each in descending order of bottle counts. Every
+		region is included, even those with no bottles in the cellar.
+		"""
 
-		return [{
-			'country': country,
-			'bottles': countryBottles[country],
-			'regions': [{
+		regions = {}
+		q = db.session.query(Region).options(*LoadProfile.bare())
+		for region in q.all():
+			regionInventory = inventory.get(region.id, {})
+			regionData = {
 				'region': region,
-				'bottles': regionBottles[country][region]
-			} for region in sorted(regionBottles[country], key=lambda r: len(regionBottles[country][r]), reverse=True)]
-		} for country in sorted(countryBottles, key=lambda c: len(countryBottles[c]), reverse=True)]
+				'count': sum(regionInventory.values()),
+				'inventoryByYear': regionInventory
+			}
+
+			if regionBottles is not None:
+				regionData['bottles'] = regionBottles.get(region.id, [])
+
+			regions.setdefault(region.country, []).append(regionData)
+
+		countries = []
+		for country in regions:
+			countryData = {
+				'country': country,
+				'count': sum([regionData['count'] for regionData in regions[country]]),
+				'regions': sorted(regions[country], key=lambda r: r['count'], reverse=True)
+			}
+
+			if regionBottles is not None:
+				countryData['bottles'] = SnapshotBottles.join([regionData['bottles'] for regionData in regions[country]])
+
+			countries.append(countryData)
+
+		return sorted(countries, key=lambda c: c['count'], reverse=True)
 
 	def byVarietal(self):
 		"""This returns a count of each varietal, separated into several
@@ -211,39 +538,55 @@ class Cellar:
 		gives a sense of how much of the varietal is featured in the cellar.
 		"""
 
-		numBuckets = 6
-		bucketWidth = 12
-
-		varietalBuckets = [[] for i in range(0, numBuckets)]
-
-		# --------------------
+		if self.snapshot is not None:
+			return self._byVarietalFromSnapshot()
 
 		totalCount = {}
 		pureCountByYear = {}
 		blendCountByYear = {}
+		varietals = {}
 
-		q = db.session.query(Varietal)
+		q = db.session.query(Varietal).options(*LoadProfile.bare())
 		for varietal in q.all():
 			totalCount[varietal] = 0
 			pureCountByYear[varietal] = {}
 			blendCountByYear[varietal] = {}
-			bucketIndex = min(numBuckets - 1, math.floor(varietal.boldness / bucketWidth))
-
-			varietalBuckets[bucketIndex].append(varietal)
+			varietals[varietal.id] = varietal
 
-		q = db.session.query(Bottle).filter(Bottle.consumption == None)
-		for bottle in q.all():
-			for blend in bottle.label.blends:
-				totalCount[blend.varietal] += blend.portion / 100
+		# Each bottle contributes once for every blend of its label, so this
+		# sums across the bottle / blend pairs, split by pure vs. blended
+		isPure = (Blend.portion == 100)
+		q = db.session.query(
+		              Varietal.id, Bottle.hold_until,
+		              func.sum(Blend.portion) / 100.0,
+		              func.sum(case((isPure, 1), else_=0)),
+		              func.sum(case((isPure, 0), else_=Blend.portion)) / 100.0) \
+		              .select_from(Bottle) \
+		              .join(Blend, Blend.label_id == Bottle.label_id) \
+		              .join(Varietal, Varietal.id == Blend.varietal_id) \
+		              .filter(Bottle.consumption == None) \
+		              .group_by(Varietal.id, Bottle.hold_until)
+
+		for varietalId, holdUntil, total, pure, blended in q.all():
+			varietal = varietals[varietalId]
+			totalCount[varietal] += total
+			pureCountByYear[varietal][holdUntil] = pure
+			blendCountByYear[varietal][holdUntil] = blended
+
+		return self._varietalBuckets(totalCount, pureCountByYear, blendCountByYear)
+
+	def _varietalBuckets(self, totalCount, pureCountByYear, blendCountByYear):
+		"""This arranges the per-varietal counts computed by byVarietal into
+		boldness buckets, boldest first.
+		"""
 
-				if bottle.hold_until not in pureCountByYear[blend.varietal]:
-					pureCountByYear[blend.varietal][bottle.hold_until] = 0
-					blendCountByYear[blend.varietal][bottle.hold_until] = 0
+		numBuckets = 6
+		bucketWidth = 12
 
-				if blend.portion == 100:
-					pureCountByYear[blend.varietal][bottle.hold_until] += 1
-				else:
-					blendCountByYear[blend.varietal][bottle.hold_until] += blend.portion / 100
+		varietalBuckets = [[] for i in range(0, numBuckets)]
+		for varietal in totalCount:
+			bucketIndex = min(numBuckets - 1, math.floor(varietal.boldness / bucketWidth))
+			varietalBuckets[bucketIndex].append(varietal)
 
 		return [{
 			'bucketName': 'Boldness ' + (
@@ -258,13 +601,173 @@ class Cellar:
 			} for varietal in sorted(varietalBuckets[i], key=lambda v: totalCount[v], reverse=True)]
 		} for i in reversed(range(0, numBuckets))]
 
+	# --------------------------------------------------------------------------------
+	# Snapshot-backed implementations. These return the same structures as the
+	# methods above, but do the counting with vectorized operations over the
+	# snapshot's columns. ORM objects are only loaded for the
+	# bottles a caller actually uses (see SnapshotBottles).
+
+	def _bottlesByYearFromSnapshot(self):
+		"""The snapshot form of bottlesByYear. Each year's bottles are a
+		SnapshotBottles, so only those actually used are loaded.
+		"""
+
+		snapshot = self.snapshot
+		inCellar = ~snapshot.bottleConsumed
+		holdYears = snapshot.effectiveHoldYears(date.today().year)[inCellar]
+		ids = snapshot.bottleIds[inCellar]
+
+		return {int(year): SnapshotBottles(ids[holdYears == year])
+		        for year in numpy.unique(holdYears)}
+
+	def _consumptionProjectionFromSnapshot(self):
+		"""The snapshot form of consumptionProjection"""
+
+		snapshot = self.snapshot
+		consumed = snapshot.bottleConsumed
+		inCellar = ~consumed
+
+		now = date.today()
+		currentYear = now.year
+
+		# Whole days, as with the dates of the database form
+		numConsumed = int(numpy.count_nonzero(consumed))
+		first = int(snapshot.bottleConsumptionOrdinals[consumed].min())
+		numYears = (now.toordinal() - first) / 365
+
+		averageAnnualConsumption = numConsumed / numYears
+		numStored = int(numpy.count_nonzero(inCellar))
+		valueStored = float(snapshot.bottleInflatedCosts[inCellar].sum())
+		totalValue = float(snapshot.bottleInflatedCosts.sum())
+
+		holdYears = snapshot.effectiveHoldYears(currentYear)[inCellar]
+		counts = numpy.bincount(holdYears - currentYear) if numStored > 0 else [0]
+		aggregated = {currentYear + offset: {'count': int(count)} for offset, count in enumerate(counts)}
+
+		carryover = 0
+		for holdYear in aggregated:
+			consumption = averageAnnualConsumption
+			if holdYear == currentYear:
+				daysLeft = (date(currentYear + 1, 1, 1) - date.today()).days
+				consumption = round(averageAnnualConsumption * daysLeft / 365)
+
+			aggregated[holdYear]['excess'] = (aggregated[holdYear]['count'] + carryover - consumption)
+			carryover = max(0, aggregated[holdYear]['excess'])
+
+		return {
+			'averageAnnualConsumption': averageAnnualConsumption,
+			'averageConsumedBottleValue': (totalValue - valueStored) / numConsumed,
+
+			'numStored': numStored,
+			'valueStored': valueStored,
+
+			'byYear': aggregated
+		}
+
+	def _inventoryByYearFromSnapshot(self):
+		"""The snapshot form of inventoryByYear"""
+
+		snapshot = self.snapshot
+		currentYear = date.today().year
+		inCellar = ~snapshot.bottleConsumed
+		bottleLabel = snapshot.bottleLabel[inCellar]
+		holdYears = snapshot.effectiveHoldYears(currentYear)[inCellar]
+
+		holdSpan = int(holdYears.max()) + 1 if len(holdYears) > 0 else 1
+		keys, counts = numpy.unique(bottleLabel * holdSpan + holdYears, return_counts=True)
+
+		labels = keys // holdSpan
+		wineries = snapshot.labelWinery[labels]
+		regions = snapshot.wineryRegion[wineries]
+
+		return InventoryByYear(currentYear, zip(
+			snapshot.labelIds[labels].tolist(), snapshot.wineryIds[wineries].tolist(),
+			snapshot.regionIds[regions].tolist(), (keys % holdSpan).tolist(), counts.tolist()))
+
+	def _byRegionFromSnapshot(self, withBottles):
+		"""The snapshot form of byRegion"""
+
+		snapshot = self.snapshot
+		inCellar = ~snapshot.bottleConsumed
+		bottleRegion = snapshot.bottleRegion[inCellar]
+		inventory = self.inventoryByYear().byRegion
+
+		regionBottles = None
+		if withBottles:
+			ids = snapshot.bottleIds[inCellar]
+
+			# Group the bottle ids by region, in one sort
+			order = numpy.argsort(bottleRegion, kind='stable')
+			bounds = numpy.searchsorted(bottleRegion[order], numpy.arange(len(snapshot.regionIds) + 1))
+
+			regionBottles = {int(regionId): SnapshotBottles(ids[order[bounds[idx]:bounds[idx + 1]]])
+			                 for idx, regionId in enumerate(snapshot.regionIds)}
+
+		return self._regionRanking(inventory, regionBottles)
+
+	def _byVarietalFromSnapshot(self):
+		"""The snapshot form of byVarietal"""
+
+		snapshot = self.snapshot
+		inCellar = ~snapshot.bottleConsumed
+
+		# First, count the bottles in the cellar for each (label, hold year)
+		holdSpan = int(snapshot.bottleHoldUntil.max()) + 1 if len(snapshot.bottleIds) > 0 else 1
+		keys, counts = numpy.unique(
+			snapshot.bottleLabel[inCellar] * holdSpan + snapshot.bottleHoldUntil[inCellar],
+			return_counts=True)
+		pairLabel = keys // holdSpan
+		pairHold = keys % holdSpan
+
+		# Then pair every blend with each of its label's (hold year, count)
+		starts = numpy.searchsorted(pairLabel, snapshot.blendLabel, side='left')
+		ends = numpy.searchsorted(pairLabel, snapshot.blendLabel, side='right')
+		perBlend = ends - starts
+		blendIdx = numpy.repeat(numpy.arange(len(snapshot.blendIds)), perBlend)
+		pairIdx = starts[blendIdx] + numpy.arange(len(blendIdx)) - numpy.repeat(numpy.cumsum(perBlend) - perBlend, perBlend)
+
+		varietal = snapshot.blendVarietal[blendIdx]
+		portion = snapshot.blendPortions[blendIdx]
+		hold = pairHold[pairIdx]
+		count = counts[pairIdx]
+		pure = (portion == 100)
+
+		# Finally, sum by (varietal, hold year)
+		groups, groupIdx = numpy.unique(varietal * holdSpan + hold, return_inverse=True)
+		total = numpy.bincount(groupIdx, weights=count * portion / 100)
+		pureCount = numpy.bincount(groupIdx, weights=numpy.where(pure, count, 0))
+		blendCount = numpy.bincount(groupIdx, weights=numpy.where(pure, 0, count * portion / 100))
+
+		varietals = {varietal.id: varietal for varietal in db.session.query(Varietal).options(*LoadProfile.bare())}
+		byIndex = [varietals[id] for id in snapshot.varietalIds]
+
+		totalCount = {varietal: 0 for varietal in byIndex}
+		pureCountByYear = {varietal: {} for varietal in byIndex}
+		blendCountByYear = {varietal: {} for varietal in byIndex}
+		for group, groupTotal, groupPure, groupBlend in zip(groups, total, pureCount, blendCount):
+			varietal = byIndex[group // holdSpan]
+			holdYear = int(group % holdSpan)
+
+			totalCount[varietal] += float(groupTotal)
+			pureCountByYear[varietal][holdYear] = int(groupPure)
+			blendCountByYear[varietal][holdYear] = float(groupBlend)
+
+		return self._varietalBuckets(totalCount, pureCountByYear, blendCountByYear)
+
 	# --------------------------------------------------------------------------------
 
 	def consume(self, bottle, consumption):
-		"""This marks a bottle as consumed on the supplied date"""
+		"""This marks a bottle as consumed on the supplied date. Its slot is
+		opened up in the layout service, if one has been loaded (otherwise the
+		slot is free the next time one is).
+		"""
+
 		bottle.consumption = consumption
 		self.logger.consumedBottle(bottle)
 
+		if self._layoutService is not None:
+			self._layoutService.free(bottle)
+
 	# --------------------------------------------------------------------------------
 
 	def clearBottlePositions(self):
@@ -273,18 +776,81 @@ class Cellar:
 		to perform a full defragmentation operation.
 		"""
 
-		q = db.session.query(Bottle).filter(Bottle.consumption == None)
+		q = db.session.query(Bottle).filter(Bottle.consumption == None) \
+		              .options(*LoadProfile.bottleLabels())
 		for bottle in q.all():
 			bottle.boldness_coord = None
 			bottle.price_coord = None
 			bottle.hold_coord = None
+			bottle.rack = None
 			self.logger.changedBottlePosition(bottle)
 
 	def computeLayout(self):
-		"""This constructs a DividoLayout for the cellar, adding the bottles
+		"""This constructs a CellarLayout for the cellar, adding the bottles
 		that we know about. With this object, bottles can be repositioned or
-		placed new.
+		placed new, in every rack of the cellar geometry.
+		"""
+
+		q = db.session.query(Bottle).filter(Bottle.consumption == None) \
+		              .options(*LoadProfile.bottleDetails())
+		return CellarLayout(q.all())
+
+	def storedLayout(self):
+		"""This returns the layout currently stored for every rack, without
+		computing a new one: the bins stored by the last full layout (see
+		LayoutService.loadBins), and the positions recorded on the bottles in
+		the cellar, with the label stored in every occupied slot. Racks without
+		stored bins have no bins. The positions are read with a single Core
+		query, without creating any ORM objects.
+		"""
+
+		geometry = cellarGeometry()
+		binsByRack = LayoutService.loadBins(geometry)
+
+		layouts = {rack.name: {
+			'rack': rack.name,
+			'boldBins': binsByRack.get(rack.name, ([], []))[0],
+			'costBins': binsByRack.get(rack.name, ([], []))[1],
+			'drinkCoords': [0],
+			'holdCoords': [idx for idx in range(1, rack.holdLevels)],
+			'slots': []
+		} for rack in geometry.racks}
+
+		q = select(Bottle.id, Bottle.rack, Bottle.boldness_coord, Bottle.price_coord, Bottle.hold_coord,
+		           Label.id, Label.vintage, Winery.name, Label.name) \
+			.join_from(Bottle, Label, Bottle.label_id == Label.id).join(Winery, Label.winery_id == Winery.id) \
+			.filter(Bottle.consumption == None) \
+			.filter(Bottle.boldness_coord != None) \
+			.order_by(Bottle.id)
+
+		for bottleId, rackName, boldCoord, priceCoord, holdCoord, labelId, vintage, wineryName, name in db.session.connection().execute(q):
+			layouts[geometry.rackNamed(rackName).name]['slots'].append({
+				'coordinate': (boldCoord, priceCoord, holdCoord),
+				'bottle': bottleId,
+				'label': labelId,
+				'description': Label.describe(vintage, wineryName, name)
+			})
+
+		return list(layouts.values())
+
+	def planDefragmentation(self):
+		"""This plans a defragmentation of the cellar that reaches a layout
+		equivalent to a full one (computeLayout of unpositioned bottles) while
+		moving as few bottles as possible. See DefragPlanner.
 		"""
 
-		q = db.session.query(Bottle).filter(Bottle.consumption == None)
-		return DividoLayout(q.all())
+		q = db.session.query(Bottle).filter(Bottle.consumption == None) \
+		              .options(*LoadProfile.bottleDetails())
+		return DefragPlanner(q.all())
+
+	def layoutService(self):
+		"""This returns a LayoutService for the cellar, loading it on first use.
+		It places and frees single bottles against the bins of the last full
+		layout, which is much cheaper than computeLayout when only a few bottles
+		need positions.
+		"""
+
+		if self._layoutService is None:
+			self._layoutService = LayoutService(self.logger)
+
+		return self._layoutService
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+
+import os
+import json
+
+# --------------------------------------------------------------------------------
+
+DefaultGeometryPath = os.path.join(os.path.dirname(__file__), '..', 'data', 'geometry.json')
+
+class RackGeometry:
+	"""This describes the shape of a single (Divido style) rack: the number of
+	boldness levels (stacks, left to right), cost levels (heights) and hold
+	levels (depths, where the first is only for bottles to drink now).
+
+	The rule decides which bottles are stored in this rack. It is a dictionary
+	of optional criteria, all of which must hold:
+
+	  countries, regions        -- lists of region country / names
+	  minBoldness, maxBoldness  -- label weighted boldness, min <= b < max
+	  minCost, maxCost          -- inflated cost, min <= c < max
+
+	A rack without a rule accepts every bottle.
+	"""
+
+	def __init__(self, name, boldLevels, costLevels, holdLevels, rule=None):
+		"""Build the rack geometry"""
+
+		self.name = name
+		self.boldLevels = boldLevels
+		self.costLevels = costLevels
+		self.holdLevels = holdLevels
+		self.rule = rule or {}
+
+	@property
+	def capacity(self):
+		"""The number of bottles the rack holds"""
+		return self.boldLevels * self.costLevels * self.holdLevels
+
+	def accepts(self, boldness, cost, region, country):
+		"""This returns whether the rule admits a bottle with the supplied
+		attributes into the rack.
+		"""
+
+		rule = self.rule
+		return (('countries' not in rule or country in rule['countries']) and
+		        ('regions' not in rule or region in rule['regions']) and
+		        ('minBoldness' not in rule or boldness >= rule['minBoldness']) and
+		        ('maxBoldness' not in rule or boldness < rule['maxBoldness']) and
+		        ('minCost' not in rule or cost >= rule['minCost']) and
+		        ('maxCost' not in rule or cost < rule['maxCost']))
+
+# The original single rack: 12 stacks, not counting the last (saved for whites
+# / other's wine / etc.), 12 different heights, and 3 depths.
+DefaultRack = RackGeometry('main', 12, 12, 3)
+
+# --------------------------------------------------------------------------------
+
+class CellarGeometry:
+	"""This describes the whole cellar, as a list of independent racks. Each
+	bottle is stored in the first rack whose rule accepts it. Bottles record
+	the name of their rack; bottles without one (positioned before racks were
+	configurable) are in the first rack.
+	"""
+
+	def __init__(self, racks):
+		"""Build the geometry from a list of RackGeometry"""
+
+		if len(racks) == 0:
+			raise RuntimeError('The cellar geometry needs at least one rack.')
+
+		self.racks = racks
+		self._racksByName = {rack.name: rack for rack in racks}
+
+	@classmethod
+	def load(cls, path):
+		"""Load the geometry from a JSON file, of the form:
+
+		  {"racks": [{"name": "main", "boldLevels": 12, "costLevels": 12,
+		              "holdLevels": 3, "rule": {...}}, ...]}
+		"""
+
+		with open(path) as f:
+			config = json.load(f)
+
+		return cls([RackGeometry(rack['name'], rack['boldLevels'], rack['costLevels'], rack['holdLevels'], rack.get('rule'))
+		            for rack in config['racks']])
+
+	@property
+	def multipleRacks(self):
+		"""Whether there is more than one rack. With a single rack, bottles do
+		not need to record their rack.
+		"""
+
+		return len(self.racks) > 1
+
+	def rackNamed(self, name):
+		"""This returns the rack with the supplied name, where None is the first
+		rack. Raises an exception for unknown names.
+		"""
+
+		if name is None:
+			return self.racks[0]
+
+		if name not in self._racksByName:
+			raise RuntimeError('Rack "%s" is not in the cellar geometry. Run defrag.py to move its bottles.' % name)
+
+		return self._racksByName[name]
+
+	def hasRack(self, name):
+		"""This returns whether a stored rack name (see storedName) is part of
+		the geometry.
+		"""
+
+		return name is None or name in self._racksByName
+
+	def storedName(self, rack):
+		"""This returns the name to record in the database for the rack. With a
+		single rack, nothing is recorded, as it is implied.
+		"""
+
+		return rack.name if self.multipleRacks else None
+
+	def rackFor(self, boldness, cost, region, country):
+		"""This returns the rack a bottle with the supplied attributes belongs
+		in, by the racks' rules.
+		"""
+
+		for rack in self.racks:
+			if rack.accepts(boldness, cost, region, country):
+				return rack
+
+		raise RuntimeError('No rack accepts a bottle of boldness %.1f, cost $%.2f from %s, %s.' % (
+			boldness, cost, region, country))
+
+	def rackForBottle(self, bottle):
+		"""This returns the rack a bottle belongs in: the one it is positioned
+		in, if any, otherwise the one its attributes select.
+		"""
+
+		if bottle.coordinate is not None:
+			return self.rackNamed(bottle.rack)
+
+		region = bottle.label.winery.region
+		return self.rackFor(bottle.label.weightedBoldness, bottle.inflatedCost, region.name, region.country)
+
+# --------------------------------------------------------------------------------
+
+_defaultGeometry = None
+
+def cellarGeometry():
+	"""This returns the cellar geometry in use, loading it on first use. The
+	CELLAR_GEOMETRY environment variable can point at a different file. Without
+	a file, the cellar is the single DefaultRack.
+	"""
+
+	global _defaultGeometry
+	if _defaultGeometry is None:
+		path = os.environ.get('CELLAR_GEOMETRY', DefaultGeometryPath)
+		_defaultGeometry = CellarGeometry.load(path) if os.path.exists(path) else CellarGeometry([DefaultRack])
+
+	return _defaultGeometry
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+
+from .dividoLayout import DividoLayout
+from .databaseLogger import NullLogger
+from .cellarGeometry import cellarGeometry
+from .layoutService import LayoutService
+
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
+
+import os
+
+# --------------------------------------------------------------------------------
+
+class LayoutBottle:
+	"""This is a detached copy of the parts of a bottle used by DividoLayout.
+	Unlike the bottle itself, it is not tied to the database session, so it can
+	be sent to another process to be laid out there.
+	"""
+
+	def __init__(self, bottle):
+		"""Copy the layout attributes of the supplied bottle"""
+
+		self.id = bottle.id
+		self.cost = bottle.cost
+		self.acquisition = bottle.acquisition
+		self.hold_until = bottle.hold_until
+
+		self.boldness_coord = bottle.boldness_coord
+		self.price_coord = bottle.price_coord
+		self.hold_coord = bottle.hold_coord
+
+		label = bottle.label
+		self.label = SimpleNamespace(
+			weightedBoldness=label.weightedBoldness, name=label.name, vintage=label.vintage,
+			winery=SimpleNamespace(name=label.winery.name))
+
+	@property
+	def coordinate(self):
+		"""This returns a simple triplet of the bottle's coordinates"""
+		if self.boldness_coord is None and self.price_coord is None and self.hold_coord is None:
+			return None
+
+		return (self.boldness_coord, self.price_coord, self.hold_coord)
+
+def _positionRack(rack, bins, records):
+	"""This lays out the unpositioned bottles of a single rack, from detached
+	LayoutBottle copies. It runs in a worker process, and returns the new
+	positions as a mapping of bottle ids to coordinates, along with the
+	overflow plan of the layout.
+	"""
+
+	layout = DividoLayout(records, bins, rack)
+	layout.positionBottles(NullLogger())
+	return ({record.id: record.coordinate for record in records}, layout.overflowPlan)
+
+# --------------------------------------------------------------------------------
+
+class CellarLayout:
+	"""This lays out a cellar of one or more racks, as described by a
+	CellarGeometry. Each bottle belongs to a single rack: the one it is
+	positioned in, or for unpositioned bottles, the first whose rule accepts it.
+	Racks are then laid out independently, each by its own DividoLayout
+	(available in layouts, by rack name).
+
+	When more than one rack has bottles to position, the racks are laid out in
+	parallel, in a pool of worker processes. The workers are sent detached
+	copies of the bottles, and only return their new positions; the bottles
+	themselves are updated (and logged) here, so the workers never touch the
+	database.
+	"""
+
+	def __init__(self, bottles, geometry=None):
+		"""Assign the supplied bottles to racks, and build the layout of each"""
+
+		self.geometry = geometry or cellarGeometry()
+		self.bottles = bottles
+
+		self.bottlesByRack = {rack.name: [] for rack in self.geometry.racks}
+		for bottle in bottles:
+			self.bottlesByRack[self.geometry.rackForBottle(bottle).name].append(bottle)
+
+		self.layouts = {rack.name: DividoLayout(self.bottlesByRack[rack.name], rack=rack)
+		                for rack in self.geometry.racks}
+		self.overflowPlans = {}
+
+	# ----------------------------------------
+
+	def positionBottles(self, logger):
+		"""Position the unpositioned bottles of every rack. See
+		DividoLayout.positionBottles for the layout of each rack. The overflow
+		plans of the racks that were laid out are kept in overflowPlans, by
+		rack name.
+		"""
+
+		racks = [rack for rack in self.geometry.racks
+		         if any(bottle.coordinate is None for bottle in self.bottlesByRack[rack.name])]
+
+		if len(racks) == 1:
+			self._positionInline(logger, racks[0])
+
+		elif len(racks) > 1:
+			self._positionInPool(logger, racks)
+
+	def storeBins(self):
+		"""This replaces the stored bins of every rack with those of this
+		layout, for placing bottles added later (see LayoutService).
+		"""
+
+		LayoutService.storeBins(self.geometry, {
+			name: (layout.boldBins, layout.costBins) for name, layout in self.layouts.items()})
+
+	# ----------------------------------------
+
+	def _positionInline(self, logger, rack):
+		"""This lays out a single rack in this process, directly on the bottles"""
+
+		unpositioned = [bottle for bottle in self.bottlesByRack[rack.name] if bottle.coordinate is None]
+		self.layouts[rack.name].positionBottles(logger)
+		self.overflowPlans[rack.name] = self.layouts[rack.name].overflowPlan
+
+		for bottle in unpositioned:
+			if bottle.coordinate is not None:
+				bottle.rack = self.geometry.storedName(rack)
+
+	def _positionInPool(self, logger, racks):
+		"""This lays out several racks at once, one per worker process, then
+		moves the bottles to the positions the workers chose. The layouts of the
+		racks are rebuilt afterwards, to reflect the new positions.
+		"""
+
+		with ProcessPoolExecutor(max_workers=min(len(racks), os.cpu_count() or 1)) as pool:
+			futures = {rack.name: pool.submit(_positionRack, rack,
+			                                  (self.layouts[rack.name].boldBins, self.layouts[rack.name].costBins),
+			                                  [LayoutBottle(bottle) for bottle in self.bottlesByRack[rack.name]])
+			           for rack in racks}
+
+			for rack in racks:
+				positions, self.overflowPlans[rack.name] = futures[rack.name].result()
+				for bottle in self.bottlesByRack[rack.name]:
+					if bottle.coordinate is None and positions[bottle.id] is not None:
+						bottle.boldness_coord, bottle.price_coord, bottle.hold_coord = positions[bottle.id]
+						bottle.rack = self.geometry.storedName(rack)
+						logger.changedBottlePosition(bottle)
+
+		for rack in racks:
+			layout = self.layouts[rack.name]
+			self.layouts[rack.name] = DividoLayout(self.bottlesByRack[rack.name], (layout.boldBins, layout.costBins), rack)
+			self.layouts[rack.name].overflowPlan = self.overflowPlans[rack.name]
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+from .raw.data_model import Region, Winery, Label, Varietal, Blend, Bottle
+from .raw.inflation import inflationTable
+from .raw import db
+
+from sqlalchemy import select, func, cast, Integer
+import numpy
+
+# --------------------------------------------------------------------------------
+
+class CellarSnapshot:
+	"""This is a read-only, columnar copy of the whole database, intended for
+	analytics. Each table is loaded with a single query into NumPy arrays, one
+	per column. Foreign keys are converted into index arrays, so that (for
+	example) wineryRegion[labelWinery[bottleLabel]] is the region index of
+	every bottle. Reports built on these arrays avoid creating ORM objects and
+	walking their relationships one bottle at a time.
+
+	Dates are split into year and month columns, plus a whole day number (as
+	date.toordinal) for date arithmetic. Consumption columns use -1 for bottles
+	still in the cellar.
+	"""
+
+	def __init__(self):
+		"""Load the snapshot from the current database session"""
+
+		regions = self._load(Region.id, Region.name, Region.country)
+		self.regionIds = regions[0]
+		self.regionNames = regions[1]
+		self.regionCountries = regions[2]
+
+		wineries = self._load(Winery.id, Winery.name, Winery.region_id)
+		self.wineryIds = wineries[0]
+		self.wineryNames = wineries[1]
+		self.wineryRegion = self._indexOf(self.regionIds, wineries[2])
+
+		labels = self._load(Label.id, Label.name, Label.vintage, Label.weighted_boldness, Label.winery_id)
+		self.labelIds = labels[0]
+		self.labelNames = labels[1]
+		self.labelVintages = labels[2]
+		self.labelBoldness = labels[3].astype(float)
+		self.labelWinery = self._indexOf(self.wineryIds, labels[4])
+
+		varietals = self._load(Varietal.id, Varietal.name, Varietal.boldness)
+		self.varietalIds = varietals[0]
+		self.varietalNames = varietals[1]
+		self.varietalBoldness = varietals[2]
+
+		blends = self._load(Blend.id, Blend.portion, Blend.label_id, Blend.varietal_id)
+		self.blendIds = blends[0]
+		self.blendPortions = blends[1]
+		self.blendLabel = self._indexOf(self.labelIds, blends[2])
+		self.blendVarietal = self._indexOf(self.varietalIds, blends[3])
+
+		bottles = self._load(
+			Bottle.id, Bottle.cost, Bottle.hold_until, Bottle.label_id,
+			cast(func.strftime('%Y', Bottle.acquisition), Integer),
+			cast(func.strftime('%m', Bottle.acquisition), Integer),
+			func.coalesce(cast(func.strftime('%Y', Bottle.consumption), Integer), -1),
+			func.coalesce(cast(func.strftime('%m', Bottle.consumption), Integer), -1),
+			func.coalesce(cast(func.julianday(Bottle.consumption) - func.julianday('0001-01-01'), Integer) + 1, -1))
+
+		self.bottleIds = bottles[0]
+		self.bottleCosts = bottles[1].astype(float)
+		self.bottleHoldUntil = bottles[2]
+		self.bottleLabel = self._indexOf(self.labelIds, bottles[3])
+		self.bottleAcquisitionYears = bottles[4]
+		self.bottleAcquisitionMonths = bottles[5]
+		self.bottleConsumptionYears = bottles[6]
+		self.bottleConsumptionMonths = bottles[7]
+		self.bottleConsumptionOrdinals = bottles[8]
+		self.bottleConsumed = self.bottleConsumptionYears >= 0
+		self.bottleInflatedCosts = inflationTable().inflateAll(
+			self.bottleCosts, self.bottleAcquisitionYears, self.bottleAcquisitionMonths)
+
+	# ----------------------------------------
+
+	@property
+	def bottleRegion(self):
+		"""The region index of each bottle"""
+		return self.wineryRegion[self.labelWinery[self.bottleLabel]]
+
+	def effectiveHoldYears(self, currentYear):
+		"""The hold year of each bottle, where hold years earlier than the
+		supplied current year are considered to be the current year (i.e.,
+		"Drink Now").
+		"""
+
+		return numpy.maximum(self.bottleHoldUntil, currentYear)
+
+	# ----------------------------------------
+
+	def _load(self, *columns):
+		"""Runs one query for the supplied columns, ordered by the first (the
+		primary key), and returns one array per column. The query runs directly
+		on the session's connection, since no ORM objects are needed. Numeric
+		columns containing NULLs become float arrays, with NaN for the NULLs.
+		"""
+
+		rows = db.session.connection().execute(select(*columns).order_by(columns[0])).all()
+		if len(rows) == 0:
+			return [numpy.array([]) for column in columns]
+
+		arrays = []
+		for values in zip(*rows):
+			array = numpy.array(values)
+			if array.dtype == object:
+				try:
+					array = array.astype(float)
+				except (TypeError, ValueError):
+					pass
+
+			arrays.append(array)
+
+		return arrays
+
+	def _indexOf(self, ids, foreignIds):
+		"""Converts foreign key values into indices of the (sorted) primary key
+		array they refer to.
+		"""
+
+		return numpy.searchsorted(ids, foreignIds)
@@ -195,7 +195,8 @@ class DatabaseLogger:
 				stylize(Fore.RED, "Consumed"),
 				stylize(Style.BRIGHT, bottle.label.description),
 				stylize(Fore.RED, "stored at"),
-				stylize(Style.BRIGHT, "(%d, %d, %d)" % (
+				stylize(Style.BRIGHT, "%s(%d, %d, %d)" % (
+					self._rackPrefix(bottle),
 					bottle.boldness_coord,
 					bottle.price_coord,
 					bottle.hold_coord)),
@@ -207,25 +208,34 @@ class DatabaseLogger:
 
 		lastStack=None
 		lastRow=None
-		for bottle in sorted(self._bottlePositions, key=lambda b: (b.coordinate[0], b.coordinate[1], -b.coordinate[2])):
+		for bottle in sorted(self._bottlePositions, key=lambda b: (b.rack or '', b.coordinate[0], b.coordinate[1], -b.coordinate[2])):
 			if bottle.boldness_coord != None or bottle.price_coord != None or bottle.hold_coord != None:
-				if bottle.boldness_coord != lastStack:
-					print(stylize(Fore.GREEN, '\n-------- Stack %d --------------------------------' % bottle.boldness_coord))
+				if (bottle.rack, bottle.boldness_coord) != lastStack:
+					print(stylize(Fore.GREEN, '\n-------- %sStack %d --------------------------------' % (
+						self._rackPrefix(bottle), bottle.boldness_coord)))
 
 				elif bottle.price_coord != lastRow:
 					print('')
 
-				lastStack = bottle.boldness_coord
+				lastStack = (bottle.rack, bottle.boldness_coord)
 				lastRow = bottle.price_coord
 
 				print("%s %s %s" % (
 					stylize(Fore.BLUE, "Move"),
 					stylize(Style.BRIGHT, bottle.label.description),
-					stylize(Fore.BLUE, "to (%d, %d, %d)" % (
+					stylize(Fore.BLUE, "to %s(%d, %d, %d)" % (
+						self._rackPrefix(bottle),
 						bottle.boldness_coord,
 						bottle.price_coord,
 						bottle.hold_coord))))
 
+	def _rackPrefix(self, bottle):
+		"""This names the rack of a bottle, for prefixing its coordinates. Only
+		cellars with several racks record them.
+		"""
+
+		return '' if bottle.rack is None else 'Rack %s ' % bottle.rack
+
 	def _printChangedWineries(self):
 		"""Print all labels that have had their wineries changed. Includes the
 		region, since this is expected to be used when splitting a region"""
@@ -235,3 +245,15 @@ class DatabaseLogger:
 				stylize(Fore.GREEN, "Change Winery:"),
 				stylize(Style.BRIGHT, label.description),
 				stylize(Style.DIM, label.winery.region.description)))
+
+# --------------------------------------------------------------------------------
+
+class NullLogger:
+	"""This accepts the bottle position notifications of DatabaseLogger, and
+	discards them. It is used for trial layouts that will not be committed as
+	they are.
+	"""
+
+	def changedBottlePosition(self, bottle):
+		"""This ignores the position change"""
+		pass
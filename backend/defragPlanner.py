@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+
+from .cellarLayout import CellarLayout
+from .cellarGeometry import cellarGeometry
+from .databaseLogger import NullLogger
+
+# --------------------------------------------------------------------------------
+
+class DefragPlanner:
+	"""This plans a defragmentation that moves as few bottles as possible. A
+	full layout is computed first, to find where every bottle should be. That
+	target is then matched against the current positions, with two
+	simplifications that keep the matching exact and linear in the number of
+	bottles:
+
+	  * Bottles of the same label and hold year are interchangeable, so only
+	    the number of each kind wanted in a place matters.
+	  * Slots in the same rack, stack and cost level are equivalent, since the
+	    layout only balances bottles across the boldness columns (and "Hold"
+	    depths) of a stack for appearance.
+
+	With both, the most bottles that can stay put is, for every stack, cost
+	level and kind of bottle, the smaller of the number the target wants there
+	and the number already there. This keeps exactly that many, and moves the
+	rest into the remaining slots of their target stack and cost level.
+
+	Positions are (rack, coordinate) pairs, with the rack as it is stored on
+	the bottle (see CellarGeometry.storedName).
+	"""
+
+	def __init__(self, bottles):
+		"""Plan the defragmentation of the supplied (unconsumed) bottles. The
+		bottles are left in their current positions until apply() is called.
+		"""
+
+		self.bottles = bottles
+		self.geometry = cellarGeometry()
+		racks = {bottle: bottle.rack for bottle in bottles}
+		current = {bottle: self._position(bottle) for bottle in bottles}
+
+		# Compute the target layout from scratch, as the full defragmentation
+		# would, then put the bottles back where they were
+		for bottle in bottles:
+			bottle.boldness_coord = bottle.price_coord = bottle.hold_coord = None
+
+		self.layout = CellarLayout(bottles, self.geometry)
+		self.layout.positionBottles(NullLogger())
+		self.target = {bottle: self._position(bottle) for bottle in bottles}
+
+		for bottle in bottles:
+			self._setPosition(bottle, current[bottle])
+			bottle.rack = racks[bottle]
+
+		self.current = current
+		self.planned = self._plan()
+
+	# ----------------------------------------
+
+	@property
+	def fullMoves(self):
+		"""The number of bottles the full defragmentation would move"""
+		return len([bottle for bottle in self.bottles if self.target[bottle] != self.current[bottle]])
+
+	@property
+	def moves(self):
+		"""The number of bottles this plan moves"""
+		return len([bottle for bottle in self.bottles if self.planned[bottle] != self.current[bottle]])
+
+	def apply(self, logger):
+		"""This moves the bottles to their planned positions, logging each one
+		that actually moves.
+		"""
+
+		for bottle in self.bottles:
+			if self.planned[bottle] != self.current[bottle]:
+				self._setPosition(bottle, self.planned[bottle])
+				logger.changedBottlePosition(bottle)
+
+	# ----------------------------------------
+
+	def _plan(self):
+		"""This computes the planned position of every bottle"""
+
+		# How many of each kind of bottle the target wants in each group, and
+		# which of the slots it used
+		demand = {}
+		targetSlots = {}
+		for bottle in sorted(self.bottles, key=lambda bottle: bottle.id):
+			group = self._group(self.target[bottle])
+			kinds = demand.setdefault(group, {})
+			kinds[self._kind(bottle)] = kinds.get(self._kind(bottle), 0) + 1
+			targetSlots.setdefault(group, []).append(self.target[bottle])
+
+		# Keep bottles that are already in a group wanting their kind
+		planned = {}
+		kept = set()
+		for bottle in sorted(self.bottles, key=lambda bottle: bottle.id):
+			if self.current[bottle] is None:
+				continue
+
+			kinds = demand.get(self._group(self.current[bottle]), {})
+			if kinds.get(self._kind(bottle), 0) > 0 and self.current[bottle] not in kept:
+				kinds[self._kind(bottle)] -= 1
+				planned[bottle] = self.current[bottle]
+				kept.add(self.current[bottle])
+
+		# Everything else fills the remaining demand for its kind, taking the
+		# target's own slots first, then any other free slot in the group
+		openDemand = {}
+		for group in sorted(demand):
+			for kind, count in demand[group].items():
+				openDemand.setdefault(kind, []).extend([group] * count)
+
+		for bottle in sorted(self.bottles, key=lambda bottle: bottle.id):
+			if bottle not in planned:
+				group = openDemand[self._kind(bottle)].pop()
+				slot = self._openSlot(group, targetSlots[group], kept)
+				planned[bottle] = slot
+				kept.add(slot)
+
+		return planned
+
+	def _openSlot(self, group, targetSlots, taken):
+		"""This finds an untaken slot in the group, preferring the slots the
+		target layout used.
+		"""
+
+		for slot in targetSlots:
+			if slot not in taken:
+				return slot
+
+		rackName, boldBin, holdBin, costCoord = group
+		rack = self.geometry.rackNamed(rackName)
+		stack = self.layout.layouts[rackName].stacks[boldBin][holdBin]
+		for holdCoord in reversed(stack.holdCoords):
+			for boldCoord in stack.boldnessCoords:
+				slot = (self.geometry.storedName(rack), (boldCoord, costCoord, holdCoord))
+				if slot not in taken:
+					return slot
+
+		raise RuntimeError("Couldn't find an open slot for a moved bottle")
+
+	def _group(self, position):
+		"""The group of equivalent slots containing a position: its rack, stack
+		(boldness bin and hold bin) and cost level. Positions outside of the
+		layout have no group.
+		"""
+
+		if position is None or not self.geometry.hasRack(position[0]):
+			return None
+
+		rack = self.geometry.rackNamed(position[0])
+		layout = self.layout.layouts[rack.name]
+		coordinate = position[1]
+		if not (0 <= coordinate[1] < rack.costLevels):
+			return None
+
+		boldBin = layout._boldnessBinIdx(coordinate[0])
+		if boldBin >= len(layout.stacks):
+			return None
+
+		holdBin = (0 if coordinate[2] == 0 else 1)
+		return (rack.name, boldBin, holdBin, coordinate[1])
+
+	def _kind(self, bottle):
+		"""Bottles of the same kind are interchangeable"""
+		return (bottle.label_id, bottle.hold_until)
+
+	def _position(self, bottle):
+		"""The position of a bottle, or None if it has none. Bottles without a
+		recorded rack are in the first rack.
+		"""
+
+		if bottle.coordinate is None:
+			return None
+
+		if self.geometry.hasRack(bottle.rack):
+			rack = self.geometry.rackNamed(bottle.rack)
+			return (self.geometry.storedName(rack), bottle.coordinate)
+
+		return (bottle.rack, bottle.coordinate)
+
+	def _setPosition(self, bottle, position):
+		"""Moves a bottle to a position (or None, for no position)"""
+
+		if position is None:
+			bottle.boldness_coord = bottle.price_coord = bottle.hold_coord = None
+		else:
+			bottle.rack = position[0]
+			bottle.boldness_coord, bottle.price_coord, bottle.hold_coord = position[1]
@@ -1,10 +1,11 @@
 from datetime import date
-from sortedcontainers import SortedList
+from collections import namedtuple
+from sortedcontainers import SortedList, SortedKeyList
 import math
+import numpy
 
-NumBoldLevels = 12 # 12 stacks, not counting last (save for whites / other's wine / etc.)
-NumCostLevels = 12 # 12 different heights
-NumHoldLevels = 3  # 3 depths, note that first is only for holdYear <= currentYear
+from .raw.inflation import inflatedCosts
+from .cellarGeometry import DefaultRack
 
 # --------------------------------------------------------------------------------
 
@@ -18,31 +19,71 @@ class BottleStack:
 	coordinates, creating a stack that allows storage of multiple bottles per
 	cost level. When positioning bottles, the boldness / hold coordinates are
 	allocated accordingly.
+
+	The stack keeps track of its occupied slots as bottles are positioned (or
+	freed): the occupied (boldness, cost, hold) coordinates, the number of bottles
+	at or above each cost level, and the number of bottles in each boldness
+	column. For every (cost, hold) coordinate, the free columns are kept sorted
+	by that usage. The open slot queries and the choice of slot for the next
+	bottle are answered from these without looking at the bottles.
 	"""
 
-	def __init__(self, boldnessCoords, holdCoords):
+	def __init__(self, boldnessCoords, holdCoords, costLevels, sortKeys, boldness):
 		"""Build the stack, positioned at the supplied coordinates. It is
 		possible for one "stack" to span multiple (physical) boldness or hold
 		coordinates, if enough bottles have the same boldness score to merit
 		multiple stacks. In the case of "Hold" stacks, all but one of the hold
 		coordinates will be used, since only the Hold vs. Drink Now attribute
 		matters. In these cases, the bottles will be balanced between all values
-		evenly during positioning.
+		evenly during positioning. The stack is costLevels high.
+
+		The sort keys map each bottle to the key ordering the unpositioned
+		bottles (see DividoLayout._sortKey), and the boldness maps each bottle to
+		its label's weighted boldness. Both are computed once for the whole
+		layout. Besides the cost ordering, the unpositioned bottles are also
+		kept in boldest-first and lightest-first order, for overflow moves (ties
+		in boldness go to the cheaper bottle in both).
 		"""
 
-		self.positioned = []
-		self.unpositioned = SortedList()
+		self.positioned = {}
+		self.sortKeys = sortKeys
+		self.unpositioned = SortedKeyList(key=sortKeys.__getitem__)
+		self.boldestUnpositioned = SortedKeyList(key=lambda bottle: (-boldness[bottle], sortKeys[bottle]))
+		self.lightestUnpositioned = SortedKeyList(key=lambda bottle: (boldness[bottle], sortKeys[bottle]))
 		self.width = len(boldnessCoords)
 		self.depth = len(holdCoords)
 		self.boldnessCoords = boldnessCoords
 		self.holdCoords = holdCoords
+		self.costLevels = costLevels
+
+		self.occupied = {}
+		self.usedAtOrAbove = [0] * (costLevels + 1)
+
+		# Columns are identified by their index in boldnessCoords, so that ties
+		# in usage go to the earlier coordinate
+		self.columnIndex = {boldCoord: column for column, boldCoord in enumerate(boldnessCoords)}
+		self.columnUsage = [0] * self.width
+		self.freeColumns = {
+			(costCoord, holdCoord): SortedList([(0, column) for column in range(0, self.width)])
+			for costCoord in range(0, costLevels) for holdCoord in holdCoords
+		}
 
 	def addPositioned(self, bottle):
 		"""Add a bottle to the stack that is already positioned (and therefore
-		should not be moved during a positionBottles() call).
+		should not be moved during a positionBottles() call). Positioned
+		bottles are tracked by id, so anything with an id and the coordinate
+		attributes will do; LayoutService uses plain slot records.
+		"""
+
+		self.positioned[bottle.id] = bottle
+		self._occupy(bottle)
+
+	def removePositioned(self, bottle):
+		"""Remove a positioned bottle from the stack (because it was consumed
+		or is about to be moved), opening up the slot it was recorded in.
 		"""
 
-		self.positioned.append(bottle)
+		self._vacate(self.positioned.pop(bottle.id))
 
 	def addUnpositioned(self, bottle):
 		"""Add a bottle to the stack that does not have a current position, or
@@ -50,6 +91,8 @@ class BottleStack:
 		"""
 
 		self.unpositioned.add(bottle)
+		self.boldestUnpositioned.add(bottle)
+		self.lightestUnpositioned.add(bottle)
 
 	def removeBoldestUnpositioned(self, num):
 		"""This finds the boldest unpositioned bottles and removes them from
@@ -57,9 +100,9 @@ class BottleStack:
 		the stack.
 		"""
 
-		boldest = sorted(self.unpositioned, key=lambda bottle: -bottle.label.weightedBoldness)[0:num]
+		boldest = list(self.boldestUnpositioned.islice(0, num))
 		for bottle in boldest:
-			self.unpositioned.remove(bottle)
+			self._removeUnpositioned(bottle)
 
 		return boldest
 
@@ -69,9 +112,9 @@ class BottleStack:
 		the stack.
 		"""
 
-		lightest = sorted(self.unpositioned, key=lambda bottle: bottle.label.weightedBoldness)[0:num]
+		lightest = list(self.lightestUnpositioned.islice(0, num))
 		for bottle in lightest:
-			self.unpositioned.remove(bottle)
+			self._removeUnpositioned(bottle)
 
 		return lightest
 
@@ -81,12 +124,8 @@ class BottleStack:
 		positioned bottles.
 		"""
 
-		available = (NumCostLevels - costCoord) * self.width * self.depth
-		used = 0
-		for bottle in self.positioned:
-			if bottle.price_coord >= costCoord: used += 1
-
-		return available - used
+		available = (self.costLevels - costCoord) * self.width * self.depth
+		return available - self.usedAtOrAbove[max(0, min(costCoord, self.costLevels))]
 
 	def availableSpace(self):
 		"""This returns the number of open slots this stack will have, after
@@ -95,6 +134,22 @@ class BottleStack:
 
 		return self.openSlotsAtOrAbove(0) - len(self.unpositioned)
 
+	def placeBottle(self, logger, bottle, costCoord):
+		"""This gives a single bottle a position within the stack, without
+		otherwise disturbing it. The bottle goes to the supplied cost coordinate
+		if there is room, otherwise the nearest more expensive level with room,
+		and failing that the nearest cheaper one. Raises an exception if the
+		stack is full.
+		"""
+
+		levels = list(range(costCoord, self.costLevels)) + list(reversed(range(0, costCoord)))
+		for level in levels:
+			if self.openSlotsAtOrAbove(level) - self.openSlotsAtOrAbove(level + 1) > 0:
+				self._placeBottle(logger, bottle, level)
+				return
+
+		raise RuntimeError('Not enough open slots for the bottle.')
+
 	def positionBottles(self, logger, costBins):
 		"""This causes all unpositioned bottles to be given positions within the
 		stack. The supplied cost bins are used to guide the placement of the
@@ -117,7 +172,7 @@ class BottleStack:
 
 		while len(self.unpositioned) > 0:
 			notEnoughRoomAbove = (openAbove < len(self.unpositioned))
-			costMeetsBin = (self.unpositioned[0].inflatedCost < costBins[costCoord][0])
+			costMeetsBin = (self.sortKeys[self.unpositioned[0]][0] < costBins[costCoord][0])
 			roomAtThisLevel = (openAtOrAbove - openAbove > 0)
 
 			if roomAtThisLevel and (notEnoughRoomAbove or costMeetsBin):
@@ -134,49 +189,102 @@ class BottleStack:
 
 	# ----------------------------------------
 
+	def _removeUnpositioned(self, bottle):
+		"""This removes a bottle from all orderings of the unpositioned bottles"""
+
+		self.unpositioned.remove(bottle)
+		self.boldestUnpositioned.remove(bottle)
+		self.lightestUnpositioned.remove(bottle)
+
+	def _occupy(self, bottle):
+		"""This records the slot taken by a newly positioned bottle, updating
+		the counts of bottles at or above each cost level, the usage of its
+		column and the free columns of every slot in the stack. The work depends
+		only on the size of the stack, not the number of bottles.
+		"""
+
+		slot = (bottle.boldness_coord, bottle.price_coord, bottle.hold_coord)
+		column = self.columnIndex.get(bottle.boldness_coord)
+
+		if column is not None:
+			usage = self.columnUsage[column]
+
+			if slot not in self.occupied and (bottle.price_coord, bottle.hold_coord) in self.freeColumns:
+				self.freeColumns[(bottle.price_coord, bottle.hold_coord)].remove((usage, column))
+
+			self._changeColumnUsage(column, usage + 1)
+
+		self.occupied[slot] = self.occupied.get(slot, 0) + 1
+		for costCoord in range(0, max(0, min(bottle.price_coord + 1, self.costLevels + 1))):
+			self.usedAtOrAbove[costCoord] += 1
+
+	def _vacate(self, bottle):
+		"""This is the reverse of _occupy, for a bottle leaving its slot"""
+
+		slot = (bottle.boldness_coord, bottle.price_coord, bottle.hold_coord)
+		column = self.columnIndex.get(bottle.boldness_coord)
+
+		self.occupied[slot] -= 1
+		if self.occupied[slot] == 0:
+			del self.occupied[slot]
+
+		for costCoord in range(0, max(0, min(bottle.price_coord + 1, self.costLevels + 1))):
+			self.usedAtOrAbove[costCoord] -= 1
+
+		if column is not None:
+			usage = self.columnUsage[column] - 1
+			self._changeColumnUsage(column, usage)
+
+			if slot not in self.occupied and (bottle.price_coord, bottle.hold_coord) in self.freeColumns:
+				self.freeColumns[(bottle.price_coord, bottle.hold_coord)].add((usage, column))
+
+	def _changeColumnUsage(self, column, usage):
+		"""This updates the usage of a column, which counts up and down the
+		whole stack, so it is re-sorted among the free columns of every slot.
+		"""
+
+		previous = self.columnUsage[column]
+		for freeColumns in self.freeColumns.values():
+			if (previous, column) in freeColumns:
+				freeColumns.remove((previous, column))
+				freeColumns.add((usage, column))
+
+		self.columnUsage[column] = usage
+
 	def _placeFirstBottle(self, logger, costCoord):
 		"""This places the bottom-most bottle of the unpositioned bottles. They
 		are always sorted by price, so this will be the cheapest of the
-		bottles. Thus, whenever we get a slot, we put this first bottle
-		there. The cost coordinate is supplied, but the boldness coordinate is
-		computed to be whichever column has the least bottles thus far.
+		bottles. Thus, whenever we get a slot, we put this first bottle there.
 		"""
 
-		# Prefer the furthest back (largest) hold coordinate
-		for holdCoord in reversed(self.holdCoords):
-			preferredBoldCoord = None
-			usageForPreferred = math.inf
-
-			# Find all candidate boldness coordinates at this hold coordinate,
-			# including the usage of that coordinate up and down the stack (to
-			# create a visual balance among spanned stacks)
-			for boldCoord in self.boldnessCoords:
-				usage = 0;
-				slotAvailable = True;
-
-				for bottle in self.positioned:
-					if bottle.boldness_coord == boldCoord:
-						usage += 1
+		bottle = self.unpositioned[0]
+		self._removeUnpositioned(bottle)
+		self._placeBottle(logger, bottle, costCoord)
 
-						if bottle.hold_coord == holdCoord and bottle.price_coord == costCoord:
-							slotAvailable = False
+	def _placeBottle(self, logger, bottle, costCoord):
+		"""This places the supplied bottle at the supplied cost coordinate. The
+		boldness coordinate is computed to be whichever free column has the
+		least bottles thus far.
+		"""
 
-				if slotAvailable and (usage < usageForPreferred):
-					preferredBoldCoord = boldCoord
-					usageForPreferred = usage
+		# Prefer the furthest back (largest) hold coordinate
+		for holdCoord in reversed(self.holdCoords):
 
-			# Now, if we have a candidate, find the lowest usage and apply it
-			# If we do not, then loop to the next hold coordinate.
-			if preferredBoldCoord is not None:
-				bottle = self.unpositioned[0]
+			# The free columns at this slot are sorted by their usage up and
+			# down the stack (to create a visual balance among spanned stacks),
+			# so the first is the preferred one. If there are none, loop to the
+			# next hold coordinate.
+			freeColumns = self.freeColumns.get((costCoord, holdCoord))
+			if freeColumns:
+				usage, column = freeColumns[0]
 
-				bottle.boldness_coord = preferredBoldCoord
+				bottle.boldness_coord = self.boldnessCoords[column]
 				bottle.price_coord = costCoord
 				bottle.hold_coord = holdCoord
 				logger.changedBottlePosition(bottle)
 
-				self.unpositioned.remove(bottle)
-				self.positioned.append(bottle)
+				self.positioned[bottle.id] = bottle
+				self._occupy(bottle)
 
 				return
 
@@ -186,29 +294,71 @@ class BottleStack:
 
 # --------------------------------------------------------------------------------
 
+# A stack with more bottles assigned than it has room for, by how many
+OverfullStack = namedtuple('OverfullStack', ['holdBin', 'boldBin', 'boldnessCoords', 'excess'])
+
+# A move of overflow bottles between neighboring stacks (boldness bins)
+OverflowTransfer = namedtuple('OverflowTransfer', ['holdBin', 'fromBin', 'toBin', 'fromCoords', 'toCoords', 'count'])
+
+class OverflowPlan:
+	"""This describes how the overflow of a layout was redistributed: the
+	stacks that were overfull, and the moves of bottles between neighboring
+	stacks that relieved them (see DividoLayout.moveOverflowBottles). A bottle
+	moving several stacks takes part in one transfer per step.
+	"""
+
+	def __init__(self):
+		"""Build an empty plan, for a layout without overflows"""
+
+		self.overfull = []
+		self.transfers = []
+
+	def __bool__(self):
+		"""Whether there were any overflows"""
+		return len(self.overfull) > 0
+
+	@property
+	def bottleSteps(self):
+		"""The number of bottles moved, counting each step between stacks"""
+		return sum([transfer.count for transfer in self.transfers])
+
+# --------------------------------------------------------------------------------
+
 class DividoLayout:
 	"""This represents the layout engine for a standard Divido cellar. Which is
 	to say, generic algorithms are hard, easier to hard-code to my specific
 	desires.
 	"""
 
-	def __init__(self, bottles):
-		"""Builds a cellar and populates it with the supplied bottles"""
+	def __init__(self, bottles, bins=None, rack=DefaultRack):
+		"""Builds a cellar and populates it with the supplied bottles. The
+		boldness and cost bins are computed from the bottles, unless they are
+		supplied (as a (boldBins, costBins) pair). The rack (a RackGeometry)
+		gives the number of boldness, cost and hold levels.
+		"""
 
 		currentYear = date.today().year
 
+		self.rack = rack
 		self.bottles = bottles
 
-		self.boldBins = self._createBins([
-			bottle.label.weightedBoldness for bottle in bottles
-		], NumBoldLevels, True)
+		boldness = numpy.array([bottle.label.weightedBoldness for bottle in bottles], dtype=float)
+		costs = inflatedCosts(bottles)
 
-		self.costBins = self._createBins([
-			bottle.inflatedCost for bottle in bottles
-		], NumCostLevels, False)
+		if bins is None:
+			self.boldBins = self._createBins(boldness, rack.boldLevels, True)
+			self.costBins = self._createBins(costs, rack.costLevels, False)
+		else:
+			self.boldBins, self.costBins = bins
+
+		self.sortKeys = {bottle: self._sortKey(bottle, cost) for bottle, cost in zip(bottles, costs.tolist())}
+		self.boldness = dict(zip(bottles, boldness.tolist()))
+
+		boldBins = self._findBins(boldness, self.boldBins)
 
 		self.drinkCoords = [0]
-		self.holdCoords = [idx for idx in range(1, NumHoldLevels)]
+		self.holdCoords = [idx for idx in range(1, rack.holdLevels)]
+		self.overflowPlan = OverflowPlan()
 
 		# --------------------
 
@@ -216,20 +366,19 @@ class DividoLayout:
 		for boldIdx in range(0, len(self.boldBins)):
 			boldnessCoords = self._boldnessCoordsForBin(boldIdx)
 			self.stacks.append([
-				BottleStack(boldnessCoords, self.drinkCoords),
-				BottleStack(boldnessCoords, self.holdCoords)
+				BottleStack(boldnessCoords, self.drinkCoords, rack.costLevels, self.sortKeys, self.boldness),
+				BottleStack(boldnessCoords, self.holdCoords, rack.costLevels, self.sortKeys, self.boldness)
 			])
 
 		# --------------------
 
-		for bottle in bottles:
+		for bottle, boldBin in zip(bottles, boldBins.tolist()):
 			if bottle.coordinate is not None:
 				boldBin = self._boldnessBinIdx(bottle.boldness_coord)
 				holdBin = (0 if bottle.hold_coord == 0 else 1)
 				self.stacks[boldBin][holdBin].addPositioned(bottle)
 
 			else:
-				boldBin = self._findBin(bottle.label.weightedBoldness, self.boldBins)
 				holdBin = (0 if bottle.hold_until <= currentYear else 1)
 				self.stacks[boldBin][holdBin].addUnpositioned(bottle)
 
@@ -240,140 +389,169 @@ class DividoLayout:
 		most of the work, this iterates over them and provides a consistent set
 		of cost bins.
 
-		However, this also now manages overflows. The basic algorithm of this is
-		to look through the boldness bins and find overflows, then move those
-		bottles to the closest bin with space (or split between both if both
-		directions are available). When "moving bottles" to a bolder bin, the
-		boldest bottles are move one step, then the boldest of that bin is moved
-		one step, etc. This prevents radical moves of bottles. Likewise for
-		lighter bin moves.
-
-		Most of this logic is untested. I wrote the basic algorithm, and it
-		worked for my one case. It may be exercised again in the future, and
-		hopefully it performs adequately in that condition.
+		However, this also now manages overflows, see moveOverflowBottles. The
+		plan of the overflow moves is kept in overflowPlan.
+		"""
+
+		self.moveOverflowBottles()
+		self.positionStacks(logger)
+
+	def moveOverflowBottles(self):
+		"""This is the first step of positionBottles, which moves unpositioned
+		bottles out of overfull stacks, into the closest stacks with space. It
+		returns (and keeps in overflowPlan) the OverflowPlan of the moves.
+
+		The moves are planned for each hold bin in one go, on the number of
+		bottles in each stack, rather than the bottles themselves. Overfull
+		stacks are visited lightest first, and send their excess to the closest
+		stack with space (or split it between both directions, if a lighter and
+		a bolder one are equally close), until they fit.
+
+		That gives the number of bottles each stack ends up with. The stacks
+		cover consecutive boldness ranges, so the net number of bottles crossing
+		the boundary between two neighboring stacks is the difference of the
+		running totals before and after. Bottles only ever cross boundaries in
+		one direction, the boldest of a stack moving bolder and the lightest
+		moving lighter, so no bottle ends up in a lighter stack than a lighter
+		bottle.
 		"""
 
-		# First, check for overfull stacks
+		self.overflowPlan = OverflowPlan()
 		for holdBin in [0, 1]:
-			for boldBin in range(0, len(self.boldBins)):
-				stack = self.stacks[boldBin][holdBin]
-
-				# This is a loop in case the closest with available space
-                # doesn't have enough. In that case, we move what we can and
-                # then loop back to keep moving
-				while stack.availableSpace() < 0:
-					bottlesToMove = -stack.availableSpace()
-
-					print("WARNING, overfilled stack %d (%r), need to move %d bottles" % (
-					        boldBin, self._boldnessCoordsForBin(boldBin), bottlesToMove))
-					print("  You may want to hand check this lightly tested algorithm")
-
-					lighterBin = None
-					for b in reversed(range(0, boldBin)):
-						lighterAvailable = self.stacks[b][holdBin].availableSpace()
-						if lighterAvailable > 0:
-							lighterBin = b
-							break
-
-					if (lighterBin is None):
-						print("  No lighter bin is available");
-					else:
-						print("  lighterBin = %d (%r), lighterAvailable = %d" % (lighterBin, self._boldnessCoordsForBin(lighterBin), lighterAvailable))
-
-					bolderBin = None
-					for b in range(boldBin + 1, len(self.boldBins)):
-						bolderAvailable = self.stacks[b][holdBin].availableSpace()
-						if bolderAvailable > 0:
-							bolderBin = b
-							break
-
-					if (bolderBin is None):
-						print("  No bolder bin is available");
-					else:
-						print("  bolderBin = %d (%r), bolderAvailable = %d" % (bolderBin, self._boldnessCoordsForBin(bolderBin), bolderAvailable))
-
-					# --------------------
-
-					if lighterBin is None and bolderBin is None:
-						raise RuntimeError('Overfull Stack with nowhere to go.')
-
-					elif bolderBin is not None and (lighterBin is None or (bolderBin - boldBin < boldBin - lighterBin)):
-						print("  Bolder bin is closer, moving there");
-						self._moveOverflowBottlesBolder(holdBin, boldBin, bolderBin, min(bottlesToMove, bolderAvailable))
-
-					elif lighterBin is not None and (bolderBin is None or (boldBin - lighterBin < bolderBin - boldBin)):
-						print("  Lighter bin is closer, moving there");
-						self._moveOverflowBottlesLighter(holdBin, boldBin, lighterBin, min(bottlesToMove, lighterAvailable))
-
-					else:
-						print("  Bolder/Lighter bins are equidistant, splitting between");
-						self._moveOverflowBottlesBolder(holdBin, boldBin, bolderBin, min(int(math.floor(bottlesToMove / 2.0)), bolderAvailable))
-						self._moveOverflowBottlesLighter(holdBin, boldBin, lighterBin, min(int(math.ceil(bottlesToMove / 2.0)), lighterAvailable))
-
-		# Now we are ready to position the bottles vertically
+			stacks = [holdStacks[holdBin] for holdStacks in self.stacks]
+			counts = [len(stack.unpositioned) for stack in stacks]
+			capacity = [stack.openSlotsAtOrAbove(0) for stack in stacks]
+
+			final = self._planOverflow(holdBin, counts, capacity)
+
+			# The net flow across each boundary, positive towards the bolder
+			# stack, from the running totals
+			flows = numpy.cumsum(counts)[:-1] - numpy.cumsum(final)[:-1]
+
+			# Bolder moves go lightest boundary first, so that a stack has
+			# received its bottles before passing its boldest on (and the
+			# reverse for lighter moves)
+			for boldBin, flow in enumerate(flows.tolist()):
+				if flow > 0:
+					self._moveOverflowBottles(holdBin, boldBin, boldBin + 1, flow)
+
+			for boldBin, flow in reversed(list(enumerate(flows.tolist()))):
+				if flow < 0:
+					self._moveOverflowBottles(holdBin, boldBin + 1, boldBin, -flow)
+
+		return self.overflowPlan
+
+	def positionStacks(self, logger):
+		"""This is the second step of positionBottles, which positions the
+		bottles within each stack, once none are overfull.
+		"""
+
 		for holdStacks in self.stacks:
 			for stack in holdStacks:
 				stack.positionBottles(logger, self.costBins)
 
 	# ----------------------------------------
 
-	def _moveOverflowBottlesBolder(self, holdBin, fromBoldBin, toBoldBin, num):
-		"""This helper moves bottles from a lighter bin to a bolder bin. The
-		number of bottles is moved one step at a time. This should help preserve
-		the condition that all bolder bottles are in bolder (or equal) bins to
-		any given bottle.
+	def _planOverflow(self, holdBin, counts, capacity):
+		"""This computes the number of bottles each stack of the hold bin ends
+		up with, from the number assigned to it and the number it has room for.
+		Overfull stacks are recorded in the overflow plan.
 		"""
 
-		print("  Moving %d overflow bottles from stacks %d (%r) to bolder stack %d (%r) for holdBin %d" % (
-			num, fromBoldBin, self._boldnessCoordsForBin(fromBoldBin), toBoldBin, self._boldnessCoordsForBin(toBoldBin), holdBin))
+		if sum(counts) > sum(capacity):
+			raise RuntimeError('Overfull Stack with nowhere to go.')
+
+		final = list(counts)
+		for boldBin in range(0, len(final)):
+			if final[boldBin] > capacity[boldBin]:
+				self.overflowPlan.overfull.append(OverfullStack(
+					holdBin, boldBin, self._boldnessCoordsForBin(boldBin), final[boldBin] - capacity[boldBin]))
+
+			while final[boldBin] > capacity[boldBin]:
+				excess = final[boldBin] - capacity[boldBin]
+				lighterBin = next((b for b in reversed(range(0, boldBin)) if final[b] < capacity[b]), None)
+				bolderBin = next((b for b in range(boldBin + 1, len(final)) if final[b] < capacity[b]), None)
+
+				if bolderBin is not None and (lighterBin is None or (bolderBin - boldBin < boldBin - lighterBin)):
+					moves = [(bolderBin, excess)]
+
+				elif lighterBin is not None and (bolderBin is None or (boldBin - lighterBin < bolderBin - boldBin)):
+					moves = [(lighterBin, excess)]
+
+				else:
+					moves = [(bolderBin, excess // 2), (lighterBin, excess - excess // 2)]
+
+				for toBin, num in moves:
+					num = min(num, capacity[toBin] - final[toBin])
+					final[toBin] += num
+					final[boldBin] -= num
 
-		for b in range(fromBoldBin, toBoldBin):
-			bottles = self.stacks[b][holdBin].removeBoldestUnpositioned(num)
-			for bottle in bottles:
-				self.stacks[b + 1][holdBin].addUnpositioned(bottle)
+		return final
 
-	def _moveOverflowBottlesLighter(self, holdBin, fromBoldBin, toBoldBin, num):
-		"""This helper is the converse of _moveOverflowBottlesBolder, which
-		moves bottles to a lighter bin.
+	def _moveOverflowBottles(self, holdBin, fromBoldBin, toBoldBin, num):
+		"""This moves bottles between neighboring stacks of the hold bin: the
+		boldest when moving to a bolder stack, or the lightest when moving to a
+		lighter one. The move is recorded in the overflow plan.
 		"""
 
-		print("  Moving %d overflow bottles from stacks %d (%r) to lighter stack %d (%r) for holdBin %d" % (
-			num, fromBoldBin, self._boldnessCoordsForBin(fromBoldBin), toBoldBin, self._boldnessCoordsForBin(toBoldBin), holdBin))
+		fromStack = self.stacks[fromBoldBin][holdBin]
+		if toBoldBin > fromBoldBin:
+			bottles = fromStack.removeBoldestUnpositioned(num)
+		else:
+			bottles = fromStack.removeLightestUnpositioned(num)
 
-		for b in range(fromBoldBin, toBoldBin, -1):
-			bottles = self.stacks[b][holdBin].removeLightestUnpositioned(num)
-			for bottle in bottles:
-				self.stacks[b - 1][holdBin].addUnpositioned(bottle)
+		for bottle in bottles:
+			self.stacks[toBoldBin][holdBin].addUnpositioned(bottle)
+
+		self.overflowPlan.transfers.append(OverflowTransfer(holdBin, fromBoldBin, toBoldBin,
+		                                                    self._boldnessCoordsForBin(fromBoldBin),
+		                                                    self._boldnessCoordsForBin(toBoldBin), num))
 
 	# ----------------------------------------
 
-	def _createBins(self, data, numBins, allowMultiple):
+	def _sortKey(self, bottle, cost):
+		"""This builds the key that orders bottles within a stack: by (inflated)
+		cost, keeping like-bottles together, as Bottle.__lt__ does. The bottle
+		id comes last, so that the order (and hence the layout) never depends on
+		the order the bottles were added in.
+		"""
+
+		return (cost, bottle.label.winery.name, bottle.label.name, bottle.label.vintage, bottle.id)
+
+	@staticmethod
+	def _createBins(data, numBins, allowMultiple):
 		"""This helper computes the bin boundaries that more or less evenly
 		spreads the supplied data points. If allowMultiple is true, then
 		clustered data will cause multiple bins to have the same
 		boundaries. That condition is represented by returning less bins than
 		requested, but with the width value (the second value of the pairs)
-		greater than 1.
+		greater than 1. Without any data, the bins are unbounded: a single bin
+		as wide as all of them if allowMultiple is true, otherwise numBins of
+		them.
 		"""
 
-		remainingData = data[:]
-		remainingData.sort()
+		if len(data) == 0:
+			return [(math.inf, numBins)] if allowMultiple else [(math.inf, 1)] * numBins
 
-		desiredPerBin = math.floor(len(data) / numBins)
+		# The data is sorted once, then the number of points below a threshold
+		# is found by binary search. Thresholds are whole numbers, stepping by
+		# one, but where a step could not complete a bin, this jumps straight to
+		# the first threshold that will (just above the point that fills it).
+		sortedData = numpy.sort(numpy.asarray(data, dtype=float))
+		numData = len(sortedData)
+
+		desiredPerBin = math.floor(numData / numBins)
 		desired = desiredPerBin
 
 		thresholds = []
-		threshold = math.floor(remainingData[0])
-		included = 0
+		threshold = math.floor(sortedData[0])
 
 		binsToGo = numBins - 1
 
 		while binsToGo > 0:
-			while len(remainingData) > 0 and remainingData[0] < threshold:
-				remainingData.pop(0)
-				included += 1
+			included = int(numpy.searchsorted(sortedData, threshold, 'left'))
 
-			if included >= desired or len(remainingData) == 0:
+			if included >= desired or included == numData:
 				binWidth = 0
 				while included >= desired - (0.25 * desiredPerBin) and binsToGo - binWidth > 0:
 					binWidth += 1
@@ -382,8 +560,10 @@ class DividoLayout:
 
 				thresholds.append((threshold, binWidth))
 				binsToGo -= binWidth
+				threshold += 1
 
-			threshold += 1
+			else:
+				threshold = max(threshold + 1, math.floor(sortedData[min(desired, numData) - 1]) + 1)
 
 		# The very last is always "< math.inf" to pick up the stragglers
 		thresholds.append((math.inf, 1))
@@ -403,7 +583,7 @@ class DividoLayout:
 		covers = 0
 		for boldThreshold, boldWidth in self.boldBins:
 			covers += boldWidth
-			if (NumBoldLevels - boldCoord - 1) < covers: break
+			if (self.rack.boldLevels - boldCoord - 1) < covers: break
 			idx += 1
 
 		return idx
@@ -417,20 +597,26 @@ class DividoLayout:
 		covers = 0
 		for boldThreshold, boldWidth in self.boldBins:
 			if idx == binIdx:
-				return [NumBoldLevels - c - 1 for c in range(covers, covers + boldWidth)]
+				return [self.rack.boldLevels - c - 1 for c in range(covers, covers + boldWidth)]
 
 			covers += boldWidth
 			idx += 1
 
-		return [NumBoldLevels - covers - 1]
+		return [self.rack.boldLevels - covers - 1]
 
 	def _findBin(self, attribute, bins):
 		"""This finds which bin the bottle should be placed in ideally, based on
 		the supplied attribute.
 		"""
 
-		for idx in range(0, len(bins) - 1):
-			if attribute < bins[idx][0]:
-				return idx
+		return int(self._findBins([attribute], bins)[0])
+
+	def _findBins(self, attributes, bins):
+		"""This is the array form of _findBin, finding the bin for every one of
+		the supplied attributes at once. Thresholds always increase, so the bin
+		is the number of thresholds (other than the last) at or below the
+		attribute.
+		"""
 
-		return len(bins) - 1
+		thresholds = numpy.array([threshold for threshold, width in bins[:-1]], dtype=float)
+		return numpy.searchsorted(thresholds, numpy.asarray(attributes, dtype=float), 'right')
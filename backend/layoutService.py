@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+
+from .raw.data_model import Label, Winery, Region, Bottle, LayoutBin
+from .raw import db
+from .dividoLayout import DividoLayout
+from .cellarGeometry import cellarGeometry
+
+from sqlalchemy import select, func
+from collections import namedtuple
+from datetime import date
+
+import math
+
+# A bottle position, as loaded from the database
+Slot = namedtuple('Slot', ['id', 'rack', 'boldness_coord', 'price_coord', 'hold_coord'])
+
+# --------------------------------------------------------------------------------
+
+class LayoutService:
+	"""This keeps a DividoLayout for every rack of the cellar up to date one
+	bottle at a time, rather than rebuilding them from every bottle in the
+	cellar. It uses the bins stored by the last full layout (see storeBins),
+	and loads only the occupied slots, with a single query that does not create
+	any ORM objects.
+
+	New bottles are then given a position with place(), and the slots of
+	consumed bottles are opened up again with free(). Both work against the
+	stacks' slot indexes, in logarithmic time.
+	"""
+
+	def __init__(self, logger, geometry=None):
+		"""Load the layout state from the current database session, without
+		writing anything. If no bins have been stored for a rack yet (they are
+		stored by defrag.py), they are computed from the bottles in the cellar,
+		for this service only; those racks are listed in unstoredRacks.
+		"""
+
+		self.logger = logger
+		self.geometry = geometry or cellarGeometry()
+
+		binsByRack = self.loadBins(self.geometry)
+		self.unstoredRacks = [rack.name for rack in self.geometry.racks if rack.name not in binsByRack]
+		if len(self.unstoredRacks) > 0:
+			binsByRack = dict(self._binsFromDatabase(), **binsByRack)
+
+		self.layouts = {rack.name: DividoLayout([], binsByRack[rack.name], rack) for rack in self.geometry.racks}
+
+		q = select(Bottle.id, Bottle.rack, Bottle.boldness_coord, Bottle.price_coord, Bottle.hold_coord) \
+			.filter(Bottle.consumption == None) \
+			.filter(Bottle.boldness_coord != None)
+
+		for row in db.session.connection().execute(q):
+			slot = Slot(*row)
+			self._stackAt(slot).addPositioned(slot)
+
+	# ----------------------------------------
+
+	def place(self, bottle):
+		"""This gives an unpositioned bottle a position in its rack, without
+		moving any other bottle. The bottle goes in the stack of its boldness
+		bin if there is room, otherwise the nearest stack that has room (see
+		BottleStack.placeBottle for the choice of slot within the stack).
+		"""
+
+		rack = self.geometry.rackForBottle(bottle)
+		layout = self.layouts[rack.name]
+
+		currentYear = date.today().year
+		holdBin = (0 if bottle.hold_until <= currentYear else 1)
+		boldBin = layout._findBin(bottle.label.weightedBoldness, layout.boldBins)
+		costCoord = min(layout._findBin(bottle.inflatedCost, layout.costBins), rack.costLevels - 1)
+
+		for b in self._binsByDistance(layout, boldBin):
+			stack = layout.stacks[b][holdBin]
+			if stack.openSlotsAtOrAbove(0) > 0:
+				bottle.rack = self.geometry.storedName(rack)
+				stack.placeBottle(self.logger, bottle, costCoord)
+				return
+
+		raise RuntimeError('No open slot for the bottle, the "%s" rack is full.' % rack.name)
+
+	def free(self, bottle):
+		"""This opens up the slot of a bottle leaving the cellar (typically
+		because it was consumed). The bottle keeps its coordinates, as a record
+		of where it was.
+		"""
+
+		if bottle.coordinate is None:
+			return
+
+		stack = self._stackAt(bottle)
+		if bottle.id in stack.positioned:
+			stack.removePositioned(bottle)
+
+	# ----------------------------------------
+
+	@staticmethod
+	def loadBins(geometry):
+		"""This returns the stored bins, as a mapping of rack names to
+		(boldBins, costBins) pairs in the form produced by
+		DividoLayout._createBins. Racks without stored bins (or that are no
+		longer part of the geometry) are absent.
+		"""
+
+		binsByRack = {}
+
+		q = db.session.query(LayoutBin).order_by(LayoutBin.id)
+		for layoutBin in q.all():
+			if geometry.hasRack(layoutBin.rack):
+				boldBins, costBins = binsByRack.setdefault(geometry.rackNamed(layoutBin.rack).name, ([], []))
+				bins = boldBins if layoutBin.kind == 'boldness' else costBins
+				bins.append((layoutBin.threshold, layoutBin.width))
+
+		return {name: (boldBins + [(math.inf, 1)], costBins + [(math.inf, 1)])
+		        for name, (boldBins, costBins) in binsByRack.items()
+		        if len(boldBins) > 0 and len(costBins) > 0}
+
+	@staticmethod
+	def storeBins(geometry, binsByRack):
+		"""This replaces the stored bins with those supplied (as a mapping of
+		rack names to (boldBins, costBins) pairs), typically from a full
+		layout. They are written along with the rest of the session.
+		"""
+
+		db.session.query(LayoutBin).delete()
+
+		for rack in geometry.racks:
+			boldBins, costBins = binsByRack[rack.name]
+			for kind, bins in [('boldness', boldBins), ('cost', costBins)]:
+				for threshold, width in bins:
+					if threshold != math.inf:
+						db.session.add(LayoutBin(kind=kind, threshold=threshold, width=width,
+						                         rack=geometry.storedName(rack)))
+
+	# ----------------------------------------
+
+	def _binsFromDatabase(self):
+		"""This computes the bins of every rack from the boldness and (inflated)
+		cost of the bottles in it, as a full layout would. Racks without bottles
+		get the unbounded bins of their geometry (see DividoLayout._createBins).
+		"""
+
+		q = select(Label.weighted_boldness, func.inflated_cost(Bottle.cost, Bottle.acquisition),
+		           Bottle.rack, Bottle.boldness_coord, Region.name, Region.country) \
+			.select_from(Bottle).join(Label, Bottle.label_id == Label.id) \
+			.join(Winery, Label.winery_id == Winery.id).join(Region, Winery.region_id == Region.id) \
+			.filter(Bottle.consumption == None)
+
+		valuesByRack = {rack.name: [] for rack in self.geometry.racks}
+		for boldness, cost, rackName, boldCoord, region, country in db.session.connection().execute(q):
+			if boldCoord is not None:
+				rack = self.geometry.rackNamed(rackName)
+			else:
+				rack = self.geometry.rackFor(boldness, cost, region, country)
+
+			valuesByRack[rack.name].append((boldness, cost))
+
+		binsByRack = {}
+		for rack in self.geometry.racks:
+			values = valuesByRack[rack.name]
+			binsByRack[rack.name] = (DividoLayout._createBins([boldness for boldness, cost in values], rack.boldLevels, True),
+			                         DividoLayout._createBins([cost for boldness, cost in values], rack.costLevels, False))
+
+		return binsByRack
+
+	def _stackAt(self, position):
+		"""This finds the stack containing the supplied position, in the rack
+		recorded for it.
+		"""
+
+		layout = self.layouts[self.geometry.rackNamed(position.rack).name]
+		boldBin = layout._boldnessBinIdx(position.boldness_coord)
+		holdBin = (0 if position.hold_coord == 0 else 1)
+		return layout.stacks[boldBin][holdBin]
+
+	def _binsByDistance(self, layout, boldBin):
+		"""This lists the boldness bins of a layout in order of distance from
+		the supplied one, bolder before lighter at the same distance.
+		"""
+
+		order = [boldBin]
+		for distance in range(1, len(layout.boldBins)):
+			order += [b for b in [boldBin + distance, boldBin - distance] if 0 <= b < len(layout.boldBins)]
+
+		return order
@@ -4,6 +4,7 @@ import os
 
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.pool import QueuePool
 
 # --------------------------------------------------------------------------------
 
@@ -15,6 +16,19 @@ else:
 	app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.getcwd() + '/data/cellar.db'
 
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+# SQLite connections are kept open and reused by each process (every worker of
+# the web service), rather than opened for every request. A connection waits
+# this long for a lock held by another process before failing.
+BusyTimeoutSeconds = 10
+
+if app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+	app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+		'poolclass': QueuePool,
+		'pool_size': 2,
+		'connect_args': {'timeout': BusyTimeoutSeconds, 'check_same_thread': False}
+	}
+
 db = SQLAlchemy(app)
 
 # --------------------------------------------------------------------------------
@@ -2,9 +2,20 @@
 
 from . import db
 from .table_base import TableBase, MakeParentChild
-
+from .inflation import inflationTable
+from .inventory import cachedInventory, clearCachedInventory
+from .schema import updateLabelValues
+
+from sqlalchemy import event, inspect, func
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session, object_session
+from sqlalchemy.orm.util import identity_key
 from datetime import date
 
+import sqlite3
+import time
+
 # --------------------------------------------------------------------------------
 
 class Region(TableBase):
@@ -24,7 +35,15 @@ class Region(TableBase):
 		"""This returns a compact description of the region, suitable for human
 		consumption.
 		"""
-		return "%s, %s" % (self.name, self.country)
+		return self.describe(self.name, self.country)
+
+	@staticmethod
+	def describe(name, country):
+		"""This builds the description of a region (see description) from its
+		parts, for regions read without the ORM.
+		"""
+
+		return "%s, %s" % (name, country)
 
 	def inventoryByYear(self):
 		"""This computes the number of bottles of from this region that are
@@ -32,25 +51,26 @@ class Region(TableBase):
 		returned as a dictionary, with the keys of the dictionaries being the
 		year and the values being the counts. All hold years earlier than the
 		current year will be considered to be the current year (i.e., "Drink
-		Now"). This effectively sums the inventoryByYear results from all labels
-		from wineries within this region.
+		Now"). This is equivalent to summing the inventoryByYear results from all
+		labels from wineries within this region, but is counted by the database
+		in a single grouped query (or taken from Cellar.inventoryByYear, if that
+		has already been computed).
 		"""
 
-		currentYear = date.today().year
-		inventory = {}
-
-		for winery in self.wineries:
-			for label in winery.labels:
-				labelByYear = label.inventoryByYear()
+		inventory = cachedInventory(object_session(self) or db.session)
+		if inventory is not None:
+			return inventory.forRegion(self.id)
 
-				for holdYear in labelByYear:
-					if holdYear not in inventory:
-						inventory[holdYear] = labelByYear[holdYear]
+		currentYear = date.today().year
+		holdYear = func.max(Bottle.hold_until, currentYear)
 
-					else:
-						inventory[holdYear] += labelByYear[holdYear]
+		q = db.session.query(holdYear, func.count(Bottle.id)) \
+		              .select_from(Bottle).join(Bottle.label).join(Label.winery) \
+		              .filter(Winery.region_id == self.id) \
+		              .filter(Bottle.consumption == None) \
+		              .group_by(holdYear)
 
-		return inventory
+		return dict(q.all())
 
 # ----------------------------------------
 
@@ -65,6 +85,25 @@ class Winery(TableBase):
 
 	name = db.Column(db.Text)
 
+	def inventoryByYear(self):
+		"""This computes the number of bottles from this winery that are owned
+		(i.e., not consumed), grouped by hold year, in the same form as
+		Label.inventoryByYear. If Cellar.inventoryByYear has already been
+		computed, the counts are taken from it; otherwise the labels' own
+		inventories are summed.
+		"""
+
+		cached = cachedInventory(object_session(self) or db.session)
+		if cached is not None:
+			return cached.forWinery(self.id)
+
+		inventory = {}
+		for label in self.labels:
+			for holdYear, count in label.inventoryByYear().items():
+				inventory[holdYear] = inventory.get(holdYear, 0) + count
+
+		return inventory
+
 MakeParentChild(Region, Winery)
 
 # ----------------------------------------
@@ -84,6 +123,16 @@ class Label(TableBase):
 	vintage = db.Column(db.Integer)
 	abv = db.Column(db.Float)
 
+	# These aggregates are maintained by triggers on the bottles, blends and
+	# varietals tables (see schema.py). They are never written from here.
+	weighted_boldness = db.Column(db.Float, server_default='0')
+	num_stored = db.Column(db.Integer, server_default='0')
+	num_consumed = db.Column(db.Integer, server_default='0')
+	unconsumed_value = db.Column(db.Float, server_default='0')
+	total_value = db.Column(db.Float, server_default='0')
+
+	_aggregates = ['weighted_boldness', 'num_stored', 'num_consumed', 'unconsumed_value', 'total_value']
+
 	@property
 	def description(self):
 		"""This returns a compact description of the bottom, including the name
@@ -91,7 +140,7 @@ class Label(TableBase):
 		as the primary name of the wine, from a human's persepective.
 		"""
 
-		return "%d %s %s" % (self.vintage, self.winery.name, self.name)
+		return self.describe(self.vintage, self.winery.name, self.name)
 
 	@property
 	def varietalDescription(self):
@@ -101,11 +150,29 @@ class Label(TableBase):
 		list of portions is returned, sorted so the most prominent varietal
 		shows up first.
 		"""
-		if len(self.blends) == 1:
-			return self.blends[0].varietal.name
 
-		blendPortions = ['%d%% %s' % (blend.portion, blend.varietal.name)
-		                 for blend in sorted(self.blends, key=lambda b: b.portion, reverse=True)]
+		return self.describeVarietals([(blend.portion, blend.varietal.name) for blend in self.blends])
+
+	@staticmethod
+	def describe(vintage, wineryName, name):
+		"""This builds the description of a label (see description) from its
+		parts, for labels read without the ORM.
+		"""
+
+		return "%d %s %s" % (vintage, wineryName, name)
+
+	@staticmethod
+	def describeVarietals(blends):
+		"""This builds the varietal description of a label (see
+		varietalDescription) from its blends, as (portion, varietal name)
+		pairs, for labels read without the ORM.
+		"""
+
+		if len(blends) == 1:
+			return blends[0][1]
+
+		blendPortions = ['%d%% %s' % (portion, name)
+		                 for portion, name in sorted(blends, key=lambda b: b[0], reverse=True)]
 
 		return '(' + ', '.join(blendPortions) + ')'
 
@@ -116,7 +183,12 @@ class Label(TableBase):
 		weighted based on the portion of the wine made up by that varietal.
 		"""
 
-		return sum([blend.varietal.boldness * blend.portion / 100.0 for blend in self.blends])
+		# The stored value is filled in by the triggers, once the label and its
+		# blends are written
+		if self.weighted_boldness is None:
+			return sum([blend.varietal.boldness * blend.portion / 100.0 for blend in self.blends])
+
+		return self.weighted_boldness
 
 	@property
 	def numberConsumed(self):
@@ -124,7 +196,7 @@ class Label(TableBase):
 		consumed.
 		"""
 
-		return len([bottle for bottle in self.bottles if bottle.consumption != None])
+		return self.num_consumed
 
 	@property
 	def unconsumedValue(self):
@@ -132,12 +204,7 @@ class Label(TableBase):
 		this label, added together.
 		"""
 
-		value = 0
-		for bottle in self.bottles:
-			if bottle.consumption == None:
-				value += bottle.inflatedCost
-
-		return value
+		return self.unconsumed_value
 
 	@property
 	def totalValue(self):
@@ -145,11 +212,7 @@ class Label(TableBase):
 		whether consumed or not.
 		"""
 
-		value = 0
-		for bottle in self.bottles:
-			value += bottle.inflatedCost
-
-		return value
+		return self.total_value
 
 	def averagePrice(self, onlyUnconsumed):
 		"""This returns the average price of the wine, either across all entries
@@ -157,18 +220,24 @@ class Label(TableBase):
 		"""
 
 		if onlyUnconsumed:
-			return self.unconsumedValue / (len(self.bottles) - self.numberConsumed)
+			return self.unconsumedValue / self.num_stored
 
-		return self.totalValue / len(self.bottles)
+		return self.totalValue / (self.num_stored + self.num_consumed)
 
 	def inventoryByYear(self):
 		"""This computes the number of bottles of this label that are owned
 		(i.e., not consumed). The results are grouped by hold year and returned
 		as a dictionary, with the keys of the dictionaries being the year and
 		the values being the counts. All hold years earlier than the current
-		year will be considered to be the current year (i.e., "Drink Now").
+		year will be considered to be the current year (i.e., "Drink Now"). If
+		Cellar.inventoryByYear has already been computed, the counts are taken
+		from it instead.
 		"""
 
+		cached = cachedInventory(object_session(self) or db.session)
+		if cached is not None:
+			return cached.forLabel(self.id)
+
 		currentYear = date.today().year
 		inventory = {}
 
@@ -223,7 +292,7 @@ MakeParentChild(Varietal, Blend)
 class Bottle(TableBase):
 	"""This represents a physical bottle, as a real-world instance of a wine
 	label. It keeps track of acquisition / consumption dates, prices, and cellar
-	coordinates.
+	rack and coordinates.
 	"""
 
 	_singular = 'bottle'
@@ -239,6 +308,7 @@ class Bottle(TableBase):
 	boldness_coord = db.Column(db.Integer)
 	price_coord = db.Column(db.Integer)
 	hold_coord = db.Column(db.Integer)
+	rack = db.Column(db.Text)
 
 	@property
 	def coordinate(self):
@@ -251,22 +321,7 @@ class Bottle(TableBase):
 	@property
 	def inflatedCost(self):
 		"""This computes the price in this year's dollars"""
-		inflated = self.cost
-
-		# https://www.in2013dollars.com/Wine-at-home/price-inflation/2020-to-2021?amount=10000
-		if self.acquisition.year <= 2018: # 2018-to-2019
-			inflated *= 1.010727
-
-		if self.acquisition.year <= 2019: # 2019-to-2020
-			inflated *= 1.002446
-
-		if self.acquisition.year <= 2020: # 2020-to-2021
-			inflated *= 1.010612
-
-		if self.acquisition.year <= 2021: # 2021-to-2022
-			inflated *= 1.011850
-
-		return round(inflated, 2)
+		return inflationTable().inflate(self.cost, self.acquisition)
 
 	def __lt__(self, other):
 		"""This comparator sorts bottles by cost, keeping like-bottles together"""
@@ -275,3 +330,146 @@ class Bottle(TableBase):
 		return selfAttrs < otherAttrs
 
 MakeParentChild(Label, Bottle)
+
+# ----------------------------------------
+
+class LayoutBin(TableBase):
+	"""This represents one of the boldness or cost bins used by the last full
+	layout of the cellar (see DividoLayout._createBins). They are stored so
+	that single bottles can be placed later against the same bins, without
+	recomputing them from every bottle. The final "< infinity" bin of each kind
+	is implied, and not stored. Each rack of the cellar has its own bins.
+	"""
+
+	_singular = 'layout_bin'
+	_plural = 'layout_bins'
+	__tablename__ = _plural
+
+	kind = db.Column(db.Text)
+	threshold = db.Column(db.Integer)
+	width = db.Column(db.Integer)
+	rack = db.Column(db.Text)
+
+# ----------------------------------------
+
+@event.listens_for(Engine, 'connect')
+def _registerSqlFunctions(dbapiConnection, connectionRecord):
+	"""This makes the inflation table available to SQL, as inflated_cost(cost,
+	acquisition), which the label aggregate triggers rely on. Dates are stored
+	as ISO formatted text.
+	"""
+
+	if isinstance(dbapiConnection, sqlite3.Connection):
+		dbapiConnection.create_function('inflated_cost', 2, lambda cost, acquisition: (
+			inflationTable().inflate(cost, date.fromisoformat(acquisition[0:10]))), deterministic=True)
+
+# ----------------------------------------
+
+# Attempts at taking the database's write lock before a flush, each waiting
+# out the busy timeout (see BusyTimeoutSeconds), before giving up. Attempt n
+# is followed by a pause of n seconds, so a refused write waits for
+# WriteLockAttempts * BusyTimeoutSeconds plus 1 + 2 + ... seconds of pauses in
+# all: 3 * 10 + 3 = 33 seconds with these values. A service worker is held for
+# that long (see lighttpd-workers.conf).
+WriteLockAttempts = 3
+
+@event.listens_for(Session, 'before_flush')
+def _lockForWriting(session, flushContext, instances):
+	"""This takes SQLite's write lock before the first flush of a transaction
+	writes anything. If another process holds it for longer than the busy
+	timeout, taking it is retried a few times before giving up. Nothing has
+	been written when the lock is refused, so the session's changes are kept
+	for another attempt. Later flushes in the same transaction already hold
+	the lock.
+	"""
+
+	connection = session.connection()
+	dbapiConnection = connection.connection.dbapi_connection
+
+	if not isinstance(dbapiConnection, sqlite3.Connection) or dbapiConnection.in_transaction:
+		return
+
+	for attempt in range(1, WriteLockAttempts + 1):
+		try:
+			connection.exec_driver_sql('BEGIN IMMEDIATE')
+			return
+
+		except OperationalError as e:
+			if 'locked' not in str(e.orig) or attempt == WriteLockAttempts:
+				raise
+
+			time.sleep(attempt)
+
+@event.listens_for(Session, 'after_flush')
+def _findStaleAggregates(session, flushContext):
+	"""The aggregate triggers update labels behind the ORM's back. This notes
+	which loaded labels were affected by the flush, so their aggregates can be
+	expired once it completes. Only changes that feed the aggregates count, so
+	repositioning bottles does not cause reloads. The values of the labels
+	whose bottles changed are recomputed here, since the triggers leave them to
+	the flush (see schema.py).
+	"""
+
+	labelIds = set()
+	valueLabelIds = set()
+	allLabels = False
+
+	for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+		state = inspect(obj)
+
+		if isinstance(obj, Bottle) and (obj in session.new or obj in session.deleted or any(
+				state.attrs[key].history.has_changes() for key in ['cost', 'acquisition', 'consumption', 'label_id'])):
+			labelIds.update(state.attrs.label_id.history.sum())
+			valueLabelIds.update(state.attrs.label_id.history.sum())
+
+		elif isinstance(obj, Blend):
+			labelIds.update(state.attrs.label_id.history.sum())
+
+		elif isinstance(obj, Varietal) and state.attrs.boldness.history.has_changes():
+			allLabels = True
+
+	updateLabelValues(session.connection(), [labelId for labelId in valueLabelIds if labelId is not None])
+
+	if allLabels:
+		session.info['staleLabels'] = [obj for obj in session.identity_map.values() if isinstance(obj, Label)]
+
+	else:
+		session.info['staleLabels'] = [label for label in [
+			session.identity_map.get(identity_key(Label, labelId)) for labelId in labelIds if labelId is not None
+		] if label is not None]
+
+@event.listens_for(Session, 'after_flush_postexec')
+def _expireStaleAggregates(session, flushContext):
+	"""This expires the aggregates found by _findStaleAggregates, so they are
+	reloaded from the database the next time they are read.
+	"""
+
+	for label in session.info.pop('staleLabels', []):
+		session.expire(label, Label._aggregates)
+
+@event.listens_for(Session, 'after_flush')
+def _clearStaleInventory(session, flushContext):
+	"""This discards the bulk inventory (see inventory.py) when a flush adds,
+	removes or moves bottles, or moves labels between wineries or wineries
+	between regions.
+	"""
+
+	changes = {
+		Bottle: ['hold_until', 'consumption', 'label_id'],
+		Label: ['winery_id'],
+		Winery: ['region_id']
+	}
+
+	for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+		if type(obj) in changes:
+			state = inspect(obj)
+			if obj in session.new or obj in session.deleted or any(
+					state.attrs[key].history.has_changes() for key in changes[type(obj)]):
+				clearCachedInventory(session)
+				return
+
+# ----------------------------------------
+
+# The parent-child back references only exist once the mappers are configured,
+# and the loading profiles refer to them directly
+db.configure_mappers()
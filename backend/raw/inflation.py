@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+import os
+import numpy
+
+# --------------------------------------------------------------------------------
+
+DefaultTablePath = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'inflation.csv')
+
+class InflationTable:
+	"""This converts bottle costs into current dollars, based on a table of
+	price index values. The table is turned into cumulative inflation factors
+	once, for every month between the first and last period in the table, so
+	inflating a cost is a single lookup and multiply. Bottles acquired before
+	the table starts use the first period; those acquired after it ends are
+	already in current dollars.
+	"""
+
+	def __init__(self, indices):
+		"""Build the factors from the supplied index values. The indices are a
+		dictionary keyed by (year, month) tuples, where month may be None for
+		annual values.
+		"""
+
+		latest = max(indices, key=lambda period: (period[0], period[1] or 12))
+		current = indices[latest]
+
+		self.firstYear = min(year for year, month in indices)
+		self.lastYear = latest[0]
+
+		# Months without their own index inherit the annual value. The extra
+		# year at the end covers everything after the table, in current dollars.
+		self.factors = numpy.ones((self.lastYear - self.firstYear + 2, 12))
+		for year in range(self.firstYear, self.lastYear + 1):
+			for month in range(1, 13):
+				index = indices.get((year, month), indices.get((year, None)))
+				if index is not None and (year, month) <= (latest[0], latest[1] or 12):
+					self.factors[year - self.firstYear][month - 1] = current / index
+
+		self._factorCache = {}
+
+	@classmethod
+	def load(cls, path):
+		"""Load the table from a file of "period,index" lines. Periods are
+		either YYYY or YYYY-MM. Blank lines and lines starting with # are
+		ignored.
+		"""
+
+		indices = {}
+		with open(path) as f:
+			for line in f:
+				line = line.strip()
+				if len(line) == 0 or line.startswith('#'):
+					continue
+
+				period, index = [part.strip() for part in line.split(',')]
+				if '-' in period:
+					year, month = period.split('-')
+					indices[(int(year), int(month))] = float(index)
+
+				else:
+					indices[(int(period), None)] = float(index)
+
+		return cls(indices)
+
+	# ----------------------------------------
+
+	def factor(self, acquisition):
+		"""This returns the multiplier converting a cost on the supplied
+		acquisition date into current dollars.
+		"""
+
+		key = (acquisition.year, acquisition.month)
+		if key not in self._factorCache:
+			yearIdx, monthIdx = self._indexOf(acquisition.year, acquisition.month)
+			self._factorCache[key] = float(self.factors[yearIdx, monthIdx])
+
+		return self._factorCache[key]
+
+	def inflate(self, cost, acquisition):
+		"""This computes the supplied cost in current dollars, rounded to the
+		cent.
+		"""
+
+		return round(cost * self.factor(acquisition), 2)
+
+	def inflateAll(self, costs, years, months):
+		"""This is the batch form of inflate. It takes parallel sequences of
+		costs, acquisition years and acquisition months, and returns an array of
+		the inflated costs.
+		"""
+
+		yearIdx, monthIdx = self._indexOf(numpy.asarray(years, dtype=int), numpy.asarray(months, dtype=int))
+		return numpy.round(numpy.asarray(costs, dtype=float) * self.factors[yearIdx, monthIdx], 2)
+
+	# ----------------------------------------
+
+	def _indexOf(self, year, month):
+		"""Computes the position within the factor table for the supplied
+		acquisition year and month. This works on scalars or arrays.
+		"""
+
+		return (numpy.clip(year, self.firstYear, self.lastYear + 1) - self.firstYear, month - 1)
+
+# --------------------------------------------------------------------------------
+
+_defaultTable = None
+
+def inflationTable():
+	"""This returns the inflation table in use, loading it on first use. The
+	CELLAR_INFLATION environment variable can point at a different table file.
+	"""
+
+	global _defaultTable
+	if _defaultTable is None:
+		_defaultTable = InflationTable.load(os.environ.get('CELLAR_INFLATION', DefaultTablePath))
+
+	return _defaultTable
+
+def inflatedCosts(bottles):
+	"""This returns an array of the inflated costs of all supplied bottles, in
+	the same order.
+	"""
+
+	return inflationTable().inflateAll(
+		[bottle.cost for bottle in bottles],
+		[bottle.acquisition.year for bottle in bottles],
+		[bottle.acquisition.month for bottle in bottles])
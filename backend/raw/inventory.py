@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+from datetime import date
+
+# --------------------------------------------------------------------------------
+
+class InventoryByYear:
+	"""This holds the number of bottles owned (i.e., not consumed) for every
+	label, grouped by hold year, along with the same counts rolled up to each
+	winery and region. Every mapping is of the form {id: {holdYear: count}},
+	where hold years earlier than the current year are considered to be the
+	current year (i.e., "Drink Now"). Labels, wineries and regions without any
+	bottles in the cellar are absent.
+
+	It is computed in bulk (see Cellar.inventoryByYear), and kept in the
+	session until the next flush that changes the bottles, so that the
+	inventoryByYear methods on the individual objects can look up their counts
+	instead of counting them again.
+	"""
+
+	def __init__(self, currentYear, rows):
+		"""Build the inventory from rows of (label id, winery id, region id,
+		hold year, count), with the hold year already clamped to the current
+		year. Each label and hold year should appear only once.
+		"""
+
+		self.currentYear = currentYear
+		self.byLabel = {}
+		self.byWinery = {}
+		self.byRegion = {}
+
+		for labelId, wineryId, regionId, holdYear, count in rows:
+			self.byLabel.setdefault(labelId, {})[holdYear] = count
+
+			wineryInventory = self.byWinery.setdefault(wineryId, {})
+			wineryInventory[holdYear] = wineryInventory.get(holdYear, 0) + count
+
+			regionInventory = self.byRegion.setdefault(regionId, {})
+			regionInventory[holdYear] = regionInventory.get(holdYear, 0) + count
+
+	# ----------------------------------------
+
+	def forLabel(self, labelId):
+		"""This returns (a copy of) the inventory of a single label"""
+		return dict(self.byLabel.get(labelId, {}))
+
+	def forWinery(self, wineryId):
+		"""This returns (a copy of) the inventory of a single winery"""
+		return dict(self.byWinery.get(wineryId, {}))
+
+	def forRegion(self, regionId):
+		"""This returns (a copy of) the inventory of a single region"""
+		return dict(self.byRegion.get(regionId, {}))
+
+# --------------------------------------------------------------------------------
+
+def cachedInventory(session):
+	"""This returns the inventory stored in the session, or None if there isn't
+	one (or it was computed in a previous year, where the "Drink Now" clamping
+	no longer holds).
+	"""
+
+	inventory = session.info.get('inventoryByYear')
+	if inventory is None or inventory.currentYear != date.today().year:
+		return None
+
+	return inventory
+
+def cacheInventory(session, inventory):
+	"""This stores the inventory in the session, for cachedInventory"""
+	session.info['inventoryByYear'] = inventory
+
+def clearCachedInventory(session):
+	"""This discards any inventory stored in the session"""
+	session.info.pop('inventoryByYear', None)
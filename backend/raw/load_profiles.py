@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+from .data_model import Winery, Label, Blend, Bottle
+
+from sqlalchemy.orm import joinedload, selectinload, lazyload
+
+# --------------------------------------------------------------------------------
+
+class LoadProfile:
+	"""This collects the relationship loading strategies used by the Cellar and
+	Repository queries. Relationships are lazy by default, so each profile
+	describes the part of the object graph a caller is about to walk, and loads
+	it in a small, fixed number of batched SELECTs. Apply a profile by passing
+	its options to a query:
+
+	  db.session.query(Bottle).options(*LoadProfile.bottleDetails())
+	"""
+
+	@staticmethod
+	def bare():
+		"""Only the rows themselves, with every relationship left lazy. This is
+		appropriate when only column values are needed.
+		"""
+
+		return [lazyload('*')]
+
+	@staticmethod
+	def bottleLabels():
+		"""Bottles along with their label, winery and region, which is enough to
+		describe where the bottle came from and to sort it.
+		"""
+
+		return [joinedload(Bottle.label).joinedload(Label.winery).joinedload(Winery.region)]
+
+	@staticmethod
+	def bottleDetails():
+		"""Bottles along with their label, winery, region, and the label's blend
+		of varietals. This covers everything the reports and the layout engine
+		read from a bottle.
+		"""
+
+		return [
+			joinedload(Bottle.label).joinedload(Label.winery).joinedload(Winery.region),
+			joinedload(Bottle.label).selectinload(Label.blends).joinedload(Blend.varietal)
+		]
+
+	@staticmethod
+	def labelBlends():
+		"""Labels along with their blends and varietals, which is what is needed
+		for boldness and varietal descriptions.
+		"""
+
+		return [selectinload(Label.blends).joinedload(Blend.varietal)]
+
+	@staticmethod
+	def labelDetails():
+		"""Labels along with their winery, region, blends and varietals. This is
+		everything needed to fully describe a label.
+		"""
+
+		return [joinedload(Label.winery).joinedload(Winery.region)] + LoadProfile.labelBlends()
+
+	@staticmethod
+	def labelInventory():
+		"""Labels with their full description, plus their bottles. This is used
+		by reports that count or price the bottles of each label.
+		"""
+
+		return LoadProfile.labelDetails() + [selectinload(Label.bottles)]
+
+	@staticmethod
+	def wineryRegions():
+		"""Wineries along with the region they are in."""
+
+		return [joinedload(Winery.region)]
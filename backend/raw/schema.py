@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+
+from . import db
+
+from datetime import datetime, timezone
+
+# --------------------------------------------------------------------------------
+
+class Migration:
+	"""This represents a single step in the evolution of the database schema. A
+	migration upgrades the database from the previous version to its own
+	version, without losing any data.
+	"""
+
+	def __init__(self, version, description, statements, check=None):
+		"""Build the migration. The check, if supplied, is called with an open
+		connection before any statement runs, and should raise a RuntimeError
+		describing why the migration cannot be applied to this database.
+		"""
+
+		self.version = version
+		self.description = description
+		self.statements = statements
+		self.check = check
+
+# ----------------------------------------
+
+def _checkDuplicateLabels(connection):
+	"""The label identity index is unique, so the migration adding it would
+	fail on duplicates. This finds them first, so they can be listed and fixed
+	by hand (typically by moving the bottles to one label and deleting the
+	other).
+	"""
+
+	duplicates = connection.exec_driver_sql("""
+		SELECT wineries.name, labels.name, labels.vintage, COUNT(*)
+		FROM labels JOIN wineries ON wineries.id = labels.winery_id
+		GROUP BY labels.winery_id, labels.name, labels.vintage
+		HAVING COUNT(*) > 1
+	""").all()
+
+	if len(duplicates) > 0:
+		raise RuntimeError('Duplicate labels must be merged before migrating:\n' + '\n'.join([
+			'  %d %s %s (%d copies)' % (vintage, winery, name, count)
+			for winery, name, vintage, count in duplicates]))
+
+# ----------------------------------------
+
+# The label aggregates are stored on the labels table. The counts and boldness
+# are kept current by the triggers below, in plain SQL, so they hold whatever
+# tool writes to the database. They are recomputed for the affected labels
+# only, which keeps each write proportional to the bottles of a single label.
+#
+# The values are in current dollars, which needs the inflation table. This is
+# only available to SQL through the inflated_cost function, registered on
+# connections made through SQLAlchemy (see data_model.py), so the values are
+# recomputed when the ORM flushes bottle changes rather than by triggers.
+# Bottle costs edited with other tools are picked up by rebuildAggregates.
+
+LabelBottleCounts = """
+	num_stored = (SELECT COUNT(*) FROM bottles
+	              WHERE bottles.label_id = labels.id AND bottles.consumption IS NULL),
+	num_consumed = (SELECT COUNT(*) FROM bottles
+	                WHERE bottles.label_id = labels.id AND bottles.consumption IS NOT NULL)
+"""
+
+LabelBottleValues = """
+	unconsumed_value = (SELECT COALESCE(SUM(inflated_cost(bottles.cost, bottles.acquisition)), 0) FROM bottles
+	                    WHERE bottles.label_id = labels.id AND bottles.consumption IS NULL),
+	total_value = (SELECT COALESCE(SUM(inflated_cost(bottles.cost, bottles.acquisition)), 0) FROM bottles
+	               WHERE bottles.label_id = labels.id)
+"""
+
+LabelBottleAggregates = LabelBottleCounts + "," + LabelBottleValues
+
+LabelBlendAggregates = """
+	weighted_boldness = (SELECT COALESCE(SUM(varietals.boldness * blends.portion / 100.0), 0)
+	                     FROM blends JOIN varietals ON varietals.id = blends.varietal_id
+	                     WHERE blends.label_id = labels.id)
+"""
+
+def _aggregateTrigger(name, event, table, aggregates, labelIds):
+	"""Builds the statement creating a trigger that recomputes the supplied
+	aggregates for the labels selected by the labelIds expression.
+	"""
+
+	return "CREATE TRIGGER IF NOT EXISTS %s AFTER %s ON %s BEGIN UPDATE labels SET %s WHERE id IN (%s); END" % (
+		name, event, table, aggregates, labelIds)
+
+# ----------------------------------------
+
+# Every write to a data table bumps a single counter (and since version 6,
+# records the time of the write), so readers that keep results around (such as
+# the web service) can tell whether anything changed with a single row read.
+# Being a trigger (in plain SQL), it also counts writes made by other processes
+# and tools, such as the sqlite3 shell. Before version 7, the label aggregate
+# triggers kept those tools from writing bottles at all.
+
+ChangeCountedTables = ['regions', 'wineries', 'labels', 'varietals', 'blends', 'bottles', 'layout_bins']
+ChangeEvents = ['INSERT', 'UPDATE', 'DELETE']
+
+DataChangeCount = "counter = counter + 1"
+DataChangeTime = "changed_at = CURRENT_TIMESTAMP"
+
+def _changeCounterTriggers(changes):
+	"""Builds the statements creating the triggers that apply the supplied
+	changes to the data_changes row on every insert, update and delete of the
+	counted tables.
+	"""
+
+	return ["CREATE TRIGGER IF NOT EXISTS %s_%s_changes AFTER %s ON %s BEGIN UPDATE data_changes SET %s; END" % (
+		table, event.lower(), event, table, changes) for table in ChangeCountedTables for event in ChangeEvents]
+
+def _dropChangeCounterTriggers():
+	"""Builds the statements dropping the change counter triggers, so they can
+	be recreated with different changes.
+	"""
+
+	return ["DROP TRIGGER IF EXISTS %s_%s_changes" % (table, event.lower())
+	        for table in ChangeCountedTables for event in ChangeEvents]
+
+# ----------------------------------------
+
+Migrations = [
+	Migration(1, 'Add secondary indexes for the cellar queries', [
+		# Nearly every report only looks at bottles still in the cellar
+		"CREATE INDEX IF NOT EXISTS bottles_unconsumed ON bottles(label_id, hold_until) WHERE consumption IS NULL",
+		"CREATE INDEX IF NOT EXISTS bottles_consumed ON bottles(consumption) WHERE consumption IS NOT NULL",
+		"CREATE INDEX IF NOT EXISTS bottles_label ON bottles(label_id)",
+		"CREATE INDEX IF NOT EXISTS blends_label ON blends(label_id)",
+		"CREATE INDEX IF NOT EXISTS blends_varietal ON blends(varietal_id)",
+		"CREATE INDEX IF NOT EXISTS labels_winery ON labels(winery_id)",
+		"CREATE INDEX IF NOT EXISTS wineries_region ON wineries(region_id)",
+		"CREATE UNIQUE INDEX IF NOT EXISTS labels_identity ON labels(winery_id, name, vintage)"
+	], _checkDuplicateLabels),
+
+	Migration(2, 'Store trigger-maintained bottle and boldness aggregates on labels', [
+		"ALTER TABLE labels ADD COLUMN weighted_boldness REAL NOT NULL DEFAULT 0",
+		"ALTER TABLE labels ADD COLUMN num_stored INTEGER NOT NULL DEFAULT 0",
+		"ALTER TABLE labels ADD COLUMN num_consumed INTEGER NOT NULL DEFAULT 0",
+		"ALTER TABLE labels ADD COLUMN unconsumed_value REAL NOT NULL DEFAULT 0",
+		"ALTER TABLE labels ADD COLUMN total_value REAL NOT NULL DEFAULT 0",
+
+		_aggregateTrigger('bottles_insert_aggregates', 'INSERT', 'bottles',
+		                  LabelBottleAggregates, 'NEW.label_id'),
+		_aggregateTrigger('bottles_delete_aggregates', 'DELETE', 'bottles',
+		                  LabelBottleAggregates, 'OLD.label_id'),
+		_aggregateTrigger('bottles_update_aggregates', 'UPDATE OF cost, acquisition, consumption, label_id', 'bottles',
+		                  LabelBottleAggregates, 'OLD.label_id, NEW.label_id'),
+
+		_aggregateTrigger('blends_insert_aggregates', 'INSERT', 'blends',
+		                  LabelBlendAggregates, 'NEW.label_id'),
+		_aggregateTrigger('blends_delete_aggregates', 'DELETE', 'blends',
+		                  LabelBlendAggregates, 'OLD.label_id'),
+		_aggregateTrigger('blends_update_aggregates', 'UPDATE OF portion, varietal_id, label_id', 'blends',
+		                  LabelBlendAggregates, 'OLD.label_id, NEW.label_id'),
+		_aggregateTrigger('varietals_update_aggregates', 'UPDATE OF boldness', 'varietals',
+		                  LabelBlendAggregates, 'SELECT label_id FROM blends WHERE varietal_id = NEW.id'),
+
+		"UPDATE labels SET %s, %s" % (LabelBottleAggregates, LabelBlendAggregates)
+	]),
+
+	Migration(3, 'Store the layout bins, for placing single bottles', [
+		"""CREATE TABLE IF NOT EXISTS layout_bins (
+			id INTEGER PRIMARY KEY AUTOINCREMENT,
+			kind TEXT NOT NULL,
+			threshold INTEGER NOT NULL,
+			width INTEGER NOT NULL
+		)"""
+	]),
+
+	# Bottles (and bins) without a rack belong to the first rack of the cellar
+	# geometry, which keeps single rack cellars as they were
+	Migration(4, 'Record the rack of each bottle and layout bin', [
+		"ALTER TABLE bottles ADD COLUMN rack TEXT",
+		"ALTER TABLE layout_bins ADD COLUMN rack TEXT"
+	]),
+
+	Migration(5, 'Count changes to the data, for invalidating cached results', [
+		"CREATE TABLE IF NOT EXISTS data_changes (counter INTEGER NOT NULL)",
+		"INSERT INTO data_changes (counter) SELECT 0 WHERE NOT EXISTS (SELECT * FROM data_changes)"
+	] + _changeCounterTriggers(DataChangeCount)),
+
+	Migration(6, 'Record the time of the last change to the data', [
+		"ALTER TABLE data_changes ADD COLUMN changed_at TEXT",
+		"UPDATE data_changes SET %s" % DataChangeTime
+	] + _dropChangeCounterTriggers() + _changeCounterTriggers('%s, %s' % (DataChangeCount, DataChangeTime))),
+
+	# The bottle triggers of version 2 also computed the values, with the
+	# inflated_cost function, so writing bottles without SQLAlchemy failed
+	Migration(7, 'Keep only the bottle counts in the label aggregate triggers', [
+		"DROP TRIGGER IF EXISTS bottles_insert_aggregates",
+		"DROP TRIGGER IF EXISTS bottles_delete_aggregates",
+		"DROP TRIGGER IF EXISTS bottles_update_aggregates",
+
+		_aggregateTrigger('bottles_insert_aggregates', 'INSERT', 'bottles',
+		                  LabelBottleCounts, 'NEW.label_id'),
+		_aggregateTrigger('bottles_delete_aggregates', 'DELETE', 'bottles',
+		                  LabelBottleCounts, 'OLD.label_id'),
+		_aggregateTrigger('bottles_update_aggregates', 'UPDATE OF consumption, label_id', 'bottles',
+		                  LabelBottleCounts, 'OLD.label_id, NEW.label_id')
+	])
+]
+
+SchemaVersion = Migrations[-1].version
+
+# --------------------------------------------------------------------------------
+
+def currentVersion():
+	"""This returns the schema version recorded in the database. Databases
+	created directly from schema.sql, or that predate versioning, are version 0.
+	"""
+
+	with db.engine.connect() as connection:
+		return connection.exec_driver_sql('PRAGMA user_version').scalar()
+
+def dataChanges():
+	"""This returns the number of writes made to the data so far (see
+	ChangeCountedTables), and the (UTC) time of the last one. The count only
+	ever grows, so results computed at one count are still current as long as
+	the count is unchanged.
+	"""
+
+	with db.engine.connect() as connection:
+		count, changedAt = connection.exec_driver_sql('SELECT counter, changed_at FROM data_changes').one()
+
+	return (count, datetime.fromisoformat(changedAt).replace(tzinfo=timezone.utc))
+
+def pendingMigrations():
+	"""This returns the list of migrations that have not been applied yet, in
+	the order they need to be applied.
+	"""
+
+	version = currentVersion()
+	return [migration for migration in Migrations if migration.version > version]
+
+def migrate():
+	"""This applies all pending migrations in order. Each migration is run in
+	its own transaction, and the schema version is updated along with it, so an
+	error leaves the database at the last successfully applied version.
+	"""
+
+	for migration in pendingMigrations():
+		with db.engine.begin() as connection:
+			# The sqlite3 module does not open a transaction for DDL statements
+			# on its own, so do so explicitly to keep the migration atomic
+			connection.exec_driver_sql('BEGIN')
+
+			if migration.check is not None:
+				migration.check(connection)
+
+			for statement in migration.statements:
+				connection.exec_driver_sql(statement)
+
+			connection.exec_driver_sql('PRAGMA user_version = %d' % migration.version)
+
+def requireCurrentSchema():
+	"""This raises an exception if the database is not at the schema version
+	this code expects. Scripts call it before touching any data, to avoid
+	running against a database that is missing columns or indexes.
+	"""
+
+	version = currentVersion()
+	if version < SchemaVersion:
+		raise RuntimeError('The database is at schema version %d, but version %d is required. Run migrate.py first.' % (
+			version, SchemaVersion))
+
+	if version > SchemaVersion:
+		raise RuntimeError('The database is at schema version %d, which is newer than this code supports (%d).' % (
+			version, SchemaVersion))
+
+def useWriteAheadLog():
+	"""This switches the database to write-ahead logging, where readers never
+	wait for a writer (nor writers for readers), only writers for each other.
+	The mode is stored in the database file, so it applies to every process
+	from then on. This returns the journal mode in effect, since some databases
+	(in memory ones, for instance) cannot use a write-ahead log.
+	"""
+
+	with db.engine.connect() as connection:
+		return connection.exec_driver_sql('PRAGMA journal_mode = WAL').scalar()
+
+def updateLabelValues(connection, labelIds):
+	"""This recomputes the stored values (see LabelBottleValues) of the labels
+	with the supplied ids, on a connection made through SQLAlchemy.
+	"""
+
+	labelIds = list(labelIds)
+	if len(labelIds) > 0:
+		connection.exec_driver_sql("UPDATE labels SET %s WHERE id IN (%s)" % (
+			LabelBottleValues, ', '.join(['?'] * len(labelIds))), tuple(labelIds))
+
+def rebuildAggregates():
+	"""This recomputes every stored label aggregate from scratch. The triggers
+	and flushes keep them current during normal use, but this is needed when
+	the inflation data changes, if bottle costs were edited without SQLAlchemy,
+	or if bottles were edited while the triggers were missing.
+	"""
+
+	with db.engine.begin() as connection:
+		connection.exec_driver_sql("UPDATE labels SET %s, %s" % (LabelBottleAggregates, LabelBlendAggregates))
@@ -2,6 +2,8 @@
 
 from . import db
 
+import operator
+
 # --------------------------------------------------------------------------------
 
 def MakeParentChild(parentClass, childClass):
@@ -9,13 +11,17 @@ def MakeParentChild(parentClass, childClass):
 	listed. The child will add a database column, named based on the parent's
 	singular form, as well as a relationship back reference for programmatic
 	access. The parent gets a plural form relationship.
+
+	Relationships are loaded lazily by default. Queries that know they will
+	walk the object graph should request an eager loading strategy through one
+	of the LoadProfile options instead.
 	"""
 
 	setattr(childClass, parentClass._singular + '_id',
 			db.Column(db.Integer, db.ForeignKey(parentClass.__tablename__ + '.id')))
 
 	setattr(parentClass, childClass._plural,
-			db.relationship(childClass, backref=parentClass._singular, lazy='immediate'))
+			db.relationship(childClass, backref=parentClass._singular))
 
 # --------------------
 
@@ -32,13 +38,47 @@ class TableBase(db.Model):
 	@property
 	def value(self):
 		"""This extracts the values of the object into a simple dictionary,
-		suitable for passing to jsonify. Values are selected based on __table__
-		object, which is created & managed by SQLAlchemy
+		suitable for JSON conversion. Values are selected based on __table__
+		object, which is created & managed by SQLAlchemy, and converted as by
+		rowSerializer.
+		"""
+
+		return {key: convert(get(self)) for key, get, convert in _columnAccessors(type(self))}
+
+	@classmethod
+	def rowSerializer(cls):
+		"""This returns a function converting a row holding this table's
+		columns by name, such as a SQLAlchemy Core result of
+		select(cls.__table__), to the same dictionary as value. Dates are
+		converted to ISO formatted strings.
 		"""
 
-		val = {}
+		accessors = _columnAccessors(cls)
+		return lambda row: {key: convert(get(row)) for key, get, convert in accessors}
+
+# ----------------------------------------
+
+_accessorCache = {}
+
+def _isoDate(value):
+	"""This formats a date (or date and time) column value for JSON"""
+	return None if value is None else value.isoformat()
+
+def _unchanged(value):
+	"""This passes a column value to JSON as it is"""
+	return value
+
+def _columnAccessors(tableClass):
+	"""This returns the list of (key, getter, converter) tuples used for
+	converting objects or rows of the supplied table class to dictionaries,
+	one for each column. The list is built the first time it is needed, and
+	kept for the class.
+	"""
 
-		for column in self.__table__.columns:
-			val[column.key] = getattr(self, column.key)
+	if tableClass not in _accessorCache:
+		_accessorCache[tableClass] = [
+			(column.key, operator.attrgetter(column.key),
+			 _isoDate if isinstance(column.type, (db.Date, db.DateTime)) else _unchanged)
+			for column in tableClass.__table__.columns]
 
-		return val
+	return _accessorCache[tableClass]
@@ -2,6 +2,8 @@
 
 from .raw.data_model import Region, Winery, Label, Varietal, Blend, Bottle
 from .raw import db
+from .raw.load_profiles import LoadProfile
+from .raw.schema import requireCurrentSchema
 from .databaseLogger import DatabaseLogger
 
 # --------------------------------------------------------------------------------
@@ -13,25 +15,32 @@ class Repository:
 
 	logger = DatabaseLogger()
 
+	def __init__(self):
+		"""Refuse to operate on a database that has not been migrated to the
+		schema version this code expects.
+		"""
+
+		requireCurrentSchema()
+
 	@property
 	def regions(self):
 		"""The returns all regions in the database"""
 
-		q = db.session.query(Region)
+		q = db.session.query(Region).options(*LoadProfile.bare())
 		return q.all()
 
 	@property
 	def wineries(self):
 		"""The returns all wineries in the database"""
 
-		q = db.session.query(Winery)
+		q = db.session.query(Winery).options(*LoadProfile.wineryRegions())
 		return q.all()
 
 	@property
 	def varietals(self):
 		"""The returns all varietals in the database"""
 
-		q = db.session.query(Varietal)
+		q = db.session.query(Varietal).options(*LoadProfile.bare())
 		return q.all()
 
 	def findLabel(self, winery, labelName, vintage):
@@ -39,10 +48,15 @@ class Repository:
 		vintage, or None if not found.
 		"""
 
+		# A winery that has not been written yet has no labels
+		if winery.id is None:
+			return None
+
 		q = db.session.query(Label) \
 		              .filter(Label.winery == winery) \
 		              .filter(Label.name == labelName) \
-		              .filter(Label.vintage == vintage)
+		              .filter(Label.vintage == vintage) \
+		              .options(*LoadProfile.labelBlends())
 
 		matching = q.all()
 		if len(matching) == 0:
@@ -75,13 +89,12 @@ class Repository:
 		db.session.add(label)
 		self.logger.newLabel(label)
 
+		# Setting the parents through the back references avoids loading the
+		# (potentially large) blend collections of each varietal
 		for varietal, portion in varietalPortions:
-			blend = Blend(portion=portion)
+			blend = Blend(portion=portion, varietal=varietal, label=label)
 			db.session.add(blend)
 
-			varietal.blends.append(blend)
-			label.blends.append(blend)
-
 		return label
 
 	def addVarietal(self, name, boldness):
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+
+from .raw.schema import dataChanges
+
+from flask import Response, request, json
+from werkzeug.http import is_resource_modified
+from datetime import date, datetime, timezone
+
+import functools
+import gzip
+
+# orjson is optional, but encodes several times faster than the json module
+try:
+	import orjson
+except ImportError:
+	orjson = None
+
+# The most responses kept at once. Query strings are supplied by the clients,
+# so this bounds the memory they can tie up; the cache starts over when full.
+MaxCachedResponses = 256
+
+# --------------------------------------------------------------------------------
+
+def jsonResponse(data):
+	"""This returns a compact JSON response of the supplied data, with sorted
+	keys, and non-string keys (such as years) converted to strings after
+	sorting, so years are in numeric order as with jsonify. It is encoded with
+	orjson when that is installed. The one difference is then that non-finite
+	numbers are written as null, rather than the non-standard Infinity and NaN;
+	the endpoints convert those to None themselves.
+	"""
+
+	if orjson is not None:
+		body = orjson.dumps(_sortedKeys(data), option=orjson.OPT_SERIALIZE_NUMPY)
+	else:
+		body = json.dumps(data, separators=(',', ':'))
+
+	return Response(body, mimetype='application/json')
+
+def _sortedKeys(data):
+	"""This returns a copy of the supplied data with the keys of every
+	dictionary sorted and converted to strings, as the json module does (it
+	sorts the keys before converting them). orjson sorts them as strings,
+	which puts 10 before 2.
+	"""
+
+	if isinstance(data, dict):
+		return {key if isinstance(key, str) else str(key): _sortedKeys(data[key]) for key in sorted(data)}
+
+	if isinstance(data, (list, tuple)):
+		return [_sortedKeys(value) for value in data]
+
+	return data
+
+# --------------------------------------------------------------------------------
+
+class ResponseCache:
+	"""This keeps the encoded JSON bodies of the web service's responses, by
+	path and query string, for as long as they are current. A response is
+	current while the data is unchanged (see dataChanges) and the calendar year
+	is the same, since the reports count the bottles ready to drink this year.
+
+	Cached responses are served straight from the stored bytes, without running
+	the endpoint (or touching the ORM). Every response carries a strong ETag
+	naming the data version it was computed from, and the time of the last
+	change as Last-Modified. Requests whose If-None-Match names the current
+	version are answered with 304 Not Modified, once the body for their path
+	is cached; a path that does not answer 200 (such as an unknown producer)
+	is never Not Modified. If-Modified-Since alone is not enough for a 304, as
+	the change time is only kept to the second.
+
+	Bodies are gzip compressed for clients that accept it. The compressed body
+	is cached next to the plain one, and has its own ETag, as a different
+	representation of the same data.
+	"""
+
+	def __init__(self):
+		"""Start with an empty cache"""
+
+		self.version = None
+		self.bodies = {}
+
+	def cached(self, endpoint):
+		"""This decorates an endpoint returning a JSON response, so that its
+		body is computed once per data version and served from the cache after
+		that. Error responses are not cached.
+		"""
+
+		@functools.wraps(endpoint)
+		def cachedEndpoint(*args, **kwargs):
+			version, lastModified = self.currentVersion()
+			if version != self.version or len(self.bodies) >= MaxCachedResponses:
+				self.version = version
+				self.bodies = {}
+
+			encoding = 'gzip' if request.accept_encodings['gzip'] > 0 else 'identity'
+			etag = version if encoding == 'identity' else '%s-%s' % (version, encoding)
+
+			key = (request.path, request.query_string)
+			bodies = self.bodies.get(key)
+			if bodies is None:
+				response = endpoint(*args, **kwargs)
+				if response.status_code != 200:
+					return response
+
+				bodies = self.bodies[key] = {'identity': response.get_data()}
+
+			# Only the ETag is compared. The change time has a resolution of a
+			# second, so two versions can share a Last-Modified.
+			if not is_resource_modified(request.environ, etag=etag):
+				return self._respond(None, etag, lastModified, encoding)
+
+			if encoding not in bodies:
+				bodies[encoding] = gzip.compress(bodies['identity'])
+
+			return self._respond(bodies[encoding], etag, lastModified, encoding)
+
+		return cachedEndpoint
+
+	@staticmethod
+	def currentVersion():
+		"""This returns the version of the data the responses are computed from,
+		as a string suitable for an ETag, along with the time it was last
+		modified. A new year counts as a modification, from its first day.
+		"""
+
+		count, changedAt = dataChanges()
+		year = date.today().year
+		return ('%d-%d' % (count, year), max(changedAt, datetime(year, 1, 1, tzinfo=timezone.utc)))
+
+	# ----------------------------------------
+
+	def _respond(self, body, etag, lastModified, encoding):
+		"""This builds the response for a cached body, or a 304 Not Modified
+		response if there is no body.
+		"""
+
+		if body is None:
+			response = Response(status=304)
+		else:
+			response = Response(body, mimetype='application/json')
+			if encoding != 'identity':
+				response.content_encoding = encoding
+
+		response.set_etag(etag)
+		response.last_modified = lastModified
+		response.vary.add('Accept-Encoding')
+		return response
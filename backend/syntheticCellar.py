@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+from .raw.data_model import Region, Winery, Label, Varietal, Blend, Bottle
+from .cellarGeometry import RackGeometry, DefaultRack
+
+from datetime import date
+import math
+import random
+
+# --------------------------------------------------------------------------------
+
+# The varietals used for the made-up labels, with their boldness
+SyntheticVarietals = [
+	('Pinot Noir', 25), ('Gamay', 20), ('Grenache', 35), ('Sangiovese', 40),
+	('Tempranillo', 45), ('Merlot', 45), ('Zinfandel', 50), ('Malbec', 55),
+	('Syrah', 58), ('Cabernet Sauvignon', 60), ('Mourvedre', 62), ('Petite Sirah', 70)
+]
+
+SyntheticRegions = [
+	('Napa Valley', 'USA'), ('Sonoma', 'USA'), ('Willamette Valley', 'USA'), ('Bordeaux', 'France'),
+	('Burgundy', 'France'), ('Rhone', 'France'), ('Rioja', 'Spain'), ('Tuscany', 'Italy'),
+	('Barossa', 'Australia'), ('Mendoza', 'Argentina')
+]
+
+class SyntheticCellar:
+	"""This makes up a cellar of the requested number of (unconsumed,
+	unpositioned) bottles, for measuring the layout engine without a database.
+	The objects are plain, transient model objects that are never added to the
+	session, with ids assigned in order, so nothing is read from or written to
+	the database.
+
+	The distributions follow a typical cellar: labels are mostly single
+	varietals, with some two and three varietal blends; bottles are bought in
+	ones, twos, half cases and cases; costs are log-normal around $35 (bolder
+	wines a little dearer); and bolder wines are more often held for later
+	years. The generator is seeded, so the same size always gives the same
+	cellar.
+	"""
+
+	def __init__(self, numBottles, seed=1, fill=0.9):
+		"""Make up the cellar. The rack is sized so that the bottles fill about
+		the supplied fraction of it.
+		"""
+
+		rng = random.Random(seed)
+		currentYear = date.today().year
+
+		self.varietals = [Varietal(id=idx + 1, name=name, boldness=boldness)
+		                  for idx, (name, boldness) in enumerate(SyntheticVarietals)]
+		self.regions = [Region(id=idx + 1, name=name, country=country)
+		                for idx, (name, country) in enumerate(SyntheticRegions)]
+
+		numWineries = max(1, numBottles // 40)
+		self.wineries = [Winery(id=idx + 1, name='Winery %d' % (idx + 1), region=rng.choice(self.regions))
+		                 for idx in range(0, numWineries)]
+
+		self.labels = []
+		self.bottles = []
+		while len(self.bottles) < numBottles:
+			label = self._makeLabel(rng, currentYear)
+			self.labels.append(label)
+
+			holdUntil = self._holdYear(rng, label, currentYear)
+			baseCost = math.exp(rng.gauss(math.log(35), 0.6)) * (0.75 + label.weighted_boldness / 140)
+			for purchase in range(0, rng.choice([1, 1, 2, 2, 3])):
+				acquisition = date(rng.randint(max(label.vintage + 1, currentYear - 8), currentYear), rng.randint(1, 12), 1)
+				cost = round(baseCost * rng.uniform(0.9, 1.1), 2)
+
+				for idx in range(0, min(rng.choice([1, 1, 2, 3, 6, 6, 12]), numBottles - len(self.bottles))):
+					self.bottles.append(Bottle(id=len(self.bottles) + 1, label=label, cost=cost,
+					                           acquisition=acquisition, hold_until=holdUntil))
+
+		self.rack = self.rackFor(numBottles, fill)
+
+	@staticmethod
+	def rackFor(numBottles, fill):
+		"""This returns a rack of the standard height and depth (see
+		DefaultRack), with as many boldness levels as needed for the bottles to
+		fill the supplied fraction of it. Larger cellars are wider, the way
+		racks are extended.
+		"""
+
+		levels = max(2, math.ceil(numBottles / (DefaultRack.costLevels * DefaultRack.holdLevels * fill)))
+		return RackGeometry('synthetic', levels, DefaultRack.costLevels, DefaultRack.holdLevels)
+
+	def clearPositions(self):
+		"""This removes the positions given by a layout, so that it can be run
+		again on the same bottles.
+		"""
+
+		for bottle in self.bottles:
+			bottle.boldness_coord = bottle.price_coord = bottle.hold_coord = None
+
+	# ----------------------------------------
+
+	def _makeLabel(self, rng, currentYear):
+		"""This makes up a label, its blend, and its weighted boldness (which
+		the database triggers would otherwise maintain).
+		"""
+
+		label = Label(id=len(self.labels) + 1, name='Label %d' % (len(self.labels) + 1),
+		              vintage=currentYear - rng.randint(2, 15), abv=round(rng.uniform(12.5, 15.5), 1),
+		              winery=rng.choice(self.wineries))
+
+		numVarietals = rng.choices([1, 2, 3], weights=[60, 30, 10])[0]
+		varietals = rng.sample(self.varietals, numVarietals)
+		portions = {1: [100], 2: rng.choice([[60, 40], [75, 25], [80, 20]]), 3: [50, 30, 20]}[numVarietals]
+
+		for varietal, portion in zip(varietals, portions):
+			Blend(label=label, varietal=varietal, portion=portion)
+
+		label.weighted_boldness = sum([varietal.boldness * portion / 100.0 for varietal, portion in zip(varietals, portions)])
+		return label
+
+	def _holdYear(self, rng, label, currentYear):
+		"""This makes up the hold year of a purchase of the label. Lighter wines
+		are mostly ready to drink, bolder ones mostly held, for up to 15 years.
+		"""
+
+		if rng.random() > 0.35 + 0.5 * label.weighted_boldness / 70:
+			return currentYear - rng.randint(0, 3)
+
+		return currentYear + min(15, 1 + int(rng.expovariate(0.3)))
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+
+# This script measures the layout engine on made-up cellars of increasing size
+# (see SyntheticCellar), without touching the database. Bin creation, setting
+# up the stacks, moving overflow bottles and positioning the bottles within the
+# stacks are timed separately, taking the best of a few runs. The results are
+# appended (as a line of JSON) to a results file, data/layout-benchmark.jsonl
+# unless another is given.
+#
+# Between each pair of sizes, the growth of every step is reported as the
+# exponent k of time ~ size^k. Linear (and n log n) steps stay close to 1. The
+# script exits with an error if any step grows clearly faster than that.
+
+# --------------------------------------------------------------------------------
+
+import json
+import math
+import os
+import sys
+import time
+import numpy
+
+from colorama import Fore, Style
+from datetime import datetime
+
+from backend.syntheticCellar import SyntheticCellar
+from backend.dividoLayout import DividoLayout
+from backend.databaseLogger import NullLogger
+from backend.raw.inflation import inflatedCosts
+from scripts.styling import stylize
+from scripts.options import parseArguments
+
+# Growth exponents above this are considered super-linear
+MaxGrowthExponent = 1.5
+
+# Times below this are mostly noise, so growth from (or to) them is not judged
+MinMeasurableSeconds = 0.05
+
+Phases = ['bins', 'setup', 'overflow', 'stacking']
+
+# Results are kept next to the cellar data, outside version control
+DefaultOutputPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'layout-benchmark.jsonl')
+
+[sizes, repeat, output] = parseArguments([
+	('s', 'sizes', 'list', 'Comma separated cellar sizes to measure (default 1000,10000,100000)'),
+	('r', 'repeat', 'count', 'Runs of each size, the best is kept (default 3)'),
+	('o', 'output', 'file', 'File to append the results to (default data/layout-benchmark.jsonl)')
+])
+
+sizes = sorted([int(size) for size in (sizes or '1000,10000,100000').split(',')])
+repeat = int(repeat or 3)
+output = output or DefaultOutputPath
+
+# ----------------------------------------
+
+def timeLayout(cellar):
+	"""This runs the layout of the cellar once, returning the time of each
+	step.
+	"""
+
+	cellar.clearPositions()
+	bottles = cellar.bottles
+	rack = cellar.rack
+
+	boldness = numpy.array([bottle.label.weightedBoldness for bottle in bottles], dtype=float)
+	costs = inflatedCosts(bottles)
+
+	seconds = {}
+	start = time.perf_counter()
+	bins = (DividoLayout._createBins(boldness, rack.boldLevels, True),
+	        DividoLayout._createBins(costs, rack.costLevels, False))
+	seconds['bins'] = time.perf_counter() - start
+
+	start = time.perf_counter()
+	layout = DividoLayout(bottles, bins, rack)
+	seconds['setup'] = time.perf_counter() - start
+
+	start = time.perf_counter()
+	layout.moveOverflowBottles()
+	seconds['overflow'] = time.perf_counter() - start
+
+	start = time.perf_counter()
+	layout.positionStacks(NullLogger())
+	seconds['stacking'] = time.perf_counter() - start
+
+	unpositioned = len([bottle for bottle in bottles if bottle.coordinate is None])
+	if unpositioned > 0:
+		raise RuntimeError('%d bottles were left unpositioned.' % unpositioned)
+
+	return seconds
+
+def growthExponent(smallSize, smallSeconds, largeSize, largeSeconds):
+	"""This returns the exponent k of time ~ size^k between two sizes. Both
+	times are floored at MinMeasurableSeconds, so that noise in very short times
+	does not look like growth (steps that stay that short show no growth).
+	"""
+
+	return math.log(max(largeSeconds, MinMeasurableSeconds) / max(smallSeconds, MinMeasurableSeconds)) / \
+	       math.log(largeSize / smallSize)
+
+# ----------------------------------------
+
+results = {}
+for size in sizes:
+	cellar = SyntheticCellar(size)
+	runs = [timeLayout(cellar) for run in range(0, repeat)]
+	results[size] = {phase: min([run[phase] for run in runs]) for phase in Phases}
+
+	print('%s %s' % (
+		stylize(Style.BRIGHT, '%7d bottles:' % size),
+		'  '.join(['%s %s' % (phase, stylize(Fore.BLUE, '%7.3fs' % results[size][phase])) for phase in Phases])))
+
+growth = {}
+superLinear = []
+for smallSize, largeSize in zip(sizes, sizes[1:]):
+	growth['%d-%d' % (smallSize, largeSize)] = exponents = {}
+	for phase in Phases:
+		exponents[phase] = growthExponent(smallSize, results[smallSize][phase], largeSize, results[largeSize][phase])
+		if exponents[phase] > MaxGrowthExponent:
+			superLinear.append('%s from %d to %d bottles' % (phase, smallSize, largeSize))
+
+	print('%s %s' % (
+		stylize(Style.BRIGHT, '%7d -> %d growth:' % (smallSize, largeSize)),
+		'  '.join(['%s %s' % (phase, stylize(Fore.RED if exponents[phase] > MaxGrowthExponent else Fore.GREEN,
+		                                     'n^%.2f' % exponents[phase])) for phase in Phases])))
+
+with open(output, 'a') as f:
+	f.write(json.dumps({
+		'date': datetime.now().isoformat(timespec='seconds'),
+		'repeat': repeat,
+		'seconds': {str(size): results[size] for size in sizes},
+		'growth': growth,
+		'superLinear': superLinear
+	}) + '\n')
+
+print()
+if len(superLinear) > 0:
+	for failure in superLinear:
+		print(stylize(Fore.RED, 'Super-linear growth: %s' % failure))
+
+	sys.exit(1)
+
+print(stylize(Fore.GREEN, 'All layout steps grow (near) linearly. Results appended to %s' % output))
@@ -16,20 +16,18 @@ regionWidth = 0
 longestHold = 0
 currentYear = date.today().year
 
-for bottle in cellar.bottles:
-	longestHold = max(longestHold, bottle.hold_until)
-
 byRegion = cellar.byRegion();
 for data in byRegion:
 	for region in data['regions']:
 		regionWidth = max(regionWidth, len(region['region'].name))
+		longestHold = max([longestHold] + list(region['inventoryByYear']))
 
 firstRegion = True
 for data in byRegion:
 	print('%s %s' % (
 		stylize(Fore.GREEN, '%2d bottle%s' % (
-			len(data['bottles']),
-			' ' if len(data['bottles']) == 1 else 's')),
+			data['count'],
+			' ' if data['count'] == 1 else 's')),
 		stylize(Style.BRIGHT, '%-*s' % (regionWidth + 8, data['country']))),
 		end = '')
 
@@ -42,12 +40,12 @@ for data in byRegion:
 	print()
 	for region in data['regions']:
 		print('%8d bottle%s %s' % (
-			len(region['bottles']),
-			' ' if len(region['bottles']) == 1 else 's',
+			region['count'],
+			' ' if region['count'] == 1 else 's',
 			stylize(Fore.BLUE, '%-*s' % (regionWidth, region['region'].name))),
 			end = '')
 
-		inventoryByYear = region['region'].inventoryByYear();
+		inventoryByYear = region['inventoryByYear']
 		for year in range(currentYear, longestHold + 1):
 			if year in inventoryByYear and inventoryByYear[year] > 0:
 				print(stylize(Fore.GREEN, ' %4d' % inventoryByYear[year]), end = '')
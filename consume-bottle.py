@@ -1,6 +1,10 @@
 #!/usr/bin/env python3
 
 # This script allows the user to find and mark a bottle as consumed
+#
+# It does not load a layout service (see LayoutService): the slot of the bottle
+# needs no freeing here, since the service reads the occupied slots from the
+# database whenever it is loaded, and consumed bottles are not among them.
 
 # --------------------------------------------------------------------------------
 
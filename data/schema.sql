@@ -1,3 +1,6 @@
+-- This creates an empty database at schema version 0. Run migrate.py afterwards
+-- to add the indexes and other additions made since then.
+
 BEGIN TRANSACTION;
 
 DROP TABLE IF EXISTS `regions`;
@@ -2,18 +2,67 @@
 
 # This script clears all bottle positions, then repositions them within the
 # cellar. It will rebalance the cellar if bottles have gotten clustered, and
-# will importantly move bottles forward as they become ready to drink.
+# will importantly move bottles forward as they become ready to drink. The bins
+# of the new layout are stored, for placing bottles added later.
+#
+# With --minimal, bottles already in an equivalent place (the same stack and
+# cost level the full layout gives a bottle of the same label and hold year)
+# stay where they are, so only the necessary moves are made.
+#
+# Stacks with more bottles than room have their overflow moved to the nearest
+# stacks with space; those moves are listed before the changes.
 
 # --------------------------------------------------------------------------------
 
+from colorama import Fore, Style
+
 from backend.raw import db
 from backend.cellar import Cellar
+from scripts.styling import stylize
 from scripts.confirm import confirmAndCommit
+from scripts.options import parseArguments
 
+[minimal] = parseArguments([('m', 'minimal', 'Only move the bottles needed to reach an equivalent layout')])
 cellar = Cellar()
-cellar.clearBottlePositions()
 
-layout = cellar.computeLayout()
-layout.positionBottles(cellar.logger)
+if minimal:
+	plan = cellar.planDefragmentation()
+	plan.apply(cellar.logger)
+	layout = plan.layout
+
+	print('%s: %s (%s)\n' % (
+		stylize(Style.BRIGHT, 'Bottles To Move'),
+		stylize(Fore.BLUE, '%d of %d' % (plan.moves, len(plan.bottles))),
+		stylize(Fore.GREEN, '%d fewer than a full defragmentation' % (plan.fullMoves - plan.moves))))
+
+else:
+	cellar.clearBottlePositions()
+
+	layout = cellar.computeLayout()
+	layout.positionBottles(cellar.logger)
+
+layout.storeBins()
+
+HoldBinNames = ['Drink Now', 'Hold']
+
+for rackName, overflowPlan in layout.overflowPlans.items():
+	inRack = (' in rack %s' % rackName) if layout.geometry.multipleRacks else ''
+
+	for overfull in overflowPlan.overfull:
+		print('%s %s' % (
+			stylize(Fore.RED, 'Overfull %s stack %r%s:' % (HoldBinNames[overfull.holdBin], overfull.boldnessCoords, inRack)),
+			stylize(Style.BRIGHT, '%d bottle%s too many' % (overfull.excess, '' if overfull.excess == 1 else 's'))))
+
+	for transfer in overflowPlan.transfers:
+		print('  %s %s' % (
+			stylize(Fore.BLUE, 'Moved %d bottle%s' % (transfer.count, '' if transfer.count == 1 else 's')),
+			'from %s stack %r to %s stack %r' % (
+				HoldBinNames[transfer.holdBin],
+				transfer.fromCoords,
+				'bolder' if transfer.toBin > transfer.fromBin else 'lighter',
+				transfer.toCoords)))
+
+	if overflowPlan:
+		print()
 
 confirmAndCommit(db, cellar.logger)
@@ -14,6 +14,7 @@ from scripts.options import parseArguments
 
 [showCosts] = parseArguments([('c', 'cost', 'Also show bottle costs')])
 cellar = Cellar()
+cellar.inventoryByYear()
 
 currentYear = date.today().year
 for label in sorted(cellar.labels, key=lambda l: l.weightedBoldness, reverse=True):
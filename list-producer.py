@@ -9,6 +9,7 @@ from datetime import date
 from colorama import Fore, Style
 
 from backend.repository import Repository
+from backend.cellar import Cellar
 from scripts.styling import stylize
 from scripts.fuzzyMatchTextEntry import textEntry
 from scripts.options import parseArguments
@@ -32,6 +33,7 @@ def getWinery(repo):
 [showCosts] = parseArguments([('c', 'cost', 'Also show bottle costs')])
 repo = Repository()
 wineryName = getWinery(repo).name
+Cellar().inventoryByYear()
 
 labels = []
 for winery in repo.wineries:
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+# This script upgrades an existing cellar database to the current schema
+# version, in place. Data is never dropped; migrations only add indexes,
+# columns and the like. New databases created from data/schema.sql also need to
+# be migrated before the other scripts will run against them.
+#
+# With --rebuild, the stored label aggregates are also recomputed from scratch.
+
+# --------------------------------------------------------------------------------
+
+from colorama import Fore, Back, Style
+
+from backend.raw.schema import currentVersion, pendingMigrations, migrate, rebuildAggregates, SchemaVersion
+from scripts.styling import stylize
+from scripts.options import parseArguments
+
+[rebuild] = parseArguments([('r', 'rebuild', 'Recompute the stored label aggregates')])
+
+pending = pendingMigrations()
+print("%s %s" % (
+	stylize(Style.BRIGHT, "Schema Version:"),
+	stylize(Fore.BLUE, "%d (current is %d)" % (currentVersion(), SchemaVersion))))
+
+if len(pending) == 0:
+	print(stylize(Fore.GREEN, "Database is up to date"))
+
+else:
+	for migration in pending:
+		print("%s %s" % (
+			stylize(Fore.GREEN, "Migrate to %d:" % migration.version),
+			stylize(Style.BRIGHT, migration.description)))
+
+	while True:
+		confirm = input("Apply [y/n]? ")
+		if confirm == 'n':
+			break
+
+		if confirm == 'y':
+			try:
+				migrate()
+
+			except RuntimeError as err:
+				print(stylize(Fore.RED, str(err)))
+
+			break
+
+if rebuild and len(pendingMigrations()) == 0:
+	rebuildAggregates()
+	print(stylize(Fore.GREEN, "Rebuilt label aggregates"))
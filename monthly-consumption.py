@@ -21,23 +21,20 @@ cellar = Cellar()
 consumption = cellar.consumptionByMonth()
 for year in sorted(consumption):
 	for month in sorted(consumption[year]):
-		count = len(consumption[year][month])
+		monthConsumption = consumption[year][month]
+		count = monthConsumption.count
 
 		monthSummary = ("%s: %s" % (
 			stylize(Fore.BLUE, "%s %d" % (calendar.month_abbr[month], year)),
 			stylize(Fore.GREEN, '%d bottle%s' % (count, ' ' if count == 1 else 's'))))
 
 		if showCosts:
-			totalCost = 0
-			for bottle in consumption[year][month]:
-				totalCost += bottle.inflatedCost
-
-			monthSummary += "  " + stylize(Style.DIM + Fore.GREEN, "$%.2f" % totalCost)
+			monthSummary += "  " + stylize(Style.DIM + Fore.GREEN, "$%.2f" % monthConsumption.cost)
 
 		print(monthSummary)
 
 		if verbose:
-			for bottle in consumption[year][month]:
+			for bottle in monthConsumption.bottles:
 				desc = "  " + bottle.label.description
 				if showCosts:
 					desc += "  " + stylize(Style.DIM, "$%.2f" % bottle.inflatedCost)
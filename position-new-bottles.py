@@ -2,16 +2,26 @@
 
 # This script loads the cellar and positions all bottles with empty
 # coordinates. This differs from defragmentation in that it will not move any
-# bottle that currently has a position
+# bottle that currently has a position. Bottles are placed against the bins of
+# the last full layout (see defrag.py), cheapest first.
 
 # --------------------------------------------------------------------------------
 
+from colorama import Fore
+
 from backend.raw import db
 from backend.cellar import Cellar
+from scripts.styling import stylize
 from scripts.confirm import confirmAndCommit
 
 cellar = Cellar()
-layout = cellar.computeLayout()
-layout.positionBottles(cellar.logger)
+layout = cellar.layoutService()
+
+if len(layout.unstoredRacks) > 0:
+	print(stylize(Fore.YELLOW, 'No layout bins are stored for %s, run defrag.py to store them' % ', '.join(layout.unstoredRacks)))
+	print()
+
+for bottle in sorted(cellar.unpositionedBottles, key=lambda bottle: (bottle.inflatedCost, bottle.id)):
+	layout.place(bottle)
 
 confirmAndCommit(db, cellar.logger)
@@ -15,7 +15,7 @@ from backend.cellar import Cellar
 from scripts.confirm import confirmAndCommit
 
 cellar = Cellar()
-layout = cellar.computeLayout()
+cellarLayout = cellar.computeLayout()
 
 # Expand out the bins into real thresholds
 def expandBins(bins):
@@ -26,109 +26,123 @@ def expandBins(bins):
 
 	return expanded
 
-boldnessThresholds = expandBins(layout.boldBins)
-costThresholds = expandBins(layout.costBins)
+# ----------------------------------------
+# Build and print the table of a single rack
+
+def printRack(layout):
+	boldnessThresholds = expandBins(layout.boldBins)
+	costThresholds = expandBins(layout.costBins)
+
+	boldnessThresholds.reverse()
 
-boldnessThresholds.reverse()
+	rows = len(costThresholds) * (len(layout.holdCoords) + len(layout.drinkCoords) + 1)
+	cols = len(boldnessThresholds) + 2
+	outputTable = [["" for c in range(0, cols)] for r in range(0, rows)]
+	outputStyle = [["" for c in range(0, cols)] for r in range(0, rows)]
 
-rows = len(costThresholds) * (len(layout.holdCoords) + len(layout.drinkCoords) + 1)
-cols = len(boldnessThresholds) + 2
-outputTable = [["" for c in range(0, cols)] for r in range(0, rows)]
-outputStyle = [["" for c in range(0, cols)] for r in range(0, rows)]
+	outputTable[0][0] = "Cost"
+	outputTable[0][1] = "Hold"
 
-outputTable[0][0] = "Cost"
-outputTable[0][1] = "Hold"
+	outputStyle[0][0] = Style.BRIGHT
+	outputStyle[0][1] = Style.BRIGHT
 
-outputStyle[0][0] = Style.BRIGHT
-outputStyle[0][1] = Style.BRIGHT
+	# Label the Holds
+	holdLabels = [];
 
-# Label the Holds
-holdLabels = [];
+	def addLabel(idx, lbl):
+		while len(holdLabels) <= idx:
+			holdLabels.append("")
+		holdLabels[idx] = lbl;
 
-def addLabel(idx, lbl):
-	while len(holdLabels) <= idx:
-		holdLabels.append("")
-	holdLabels[idx] = lbl;
+	for idx in layout.drinkCoords:
+		addLabel(idx, "Drink Now");
 
-for idx in layout.drinkCoords:
-	addLabel(idx, "Drink Now");
+	for idx in layout.holdCoords:
+		addLabel(idx, "Hold");
 
-for idx in layout.holdCoords:
-	addLabel(idx, "Hold");
+	# Label the Boldness
+	boldnessLabels = ['Boldness < %d' % b if b != math.inf else 'Bolder' for b in boldnessThresholds]
+	for idx, label in enumerate(boldnessLabels):
+		outputTable[0][idx + 2] = label
+		outputStyle[0][idx + 2] = Style.BRIGHT
 
-# Label the Boldness
-boldnessLabels = ['Boldness < %d' % b if b != math.inf else 'Bolder' for b in boldnessThresholds]
-for idx, label in enumerate(boldnessLabels):
-	outputTable[0][idx + 2] = label
-	outputStyle[0][idx + 2] = Style.BRIGHT
+	# Label the Costs
+	costLabels = ['< $%.0f' % c if c != math.inf else '$ more' for c in costThresholds]
+	for idx, label in enumerate(costLabels):
+		outputTable[(len(costThresholds) - idx - 1) * (len(holdLabels) + 1) + 1][0] = label
+		outputStyle[(len(costThresholds) - idx - 1) * (len(holdLabels) + 1) + 1][0] = Fore.GREEN
 
-# Label the Costs
-costLabels = ['< $%.0f' % c if c != math.inf else '$ more' for c in costThresholds]
-for idx, label in enumerate(costLabels):
-	outputTable[(len(costThresholds) - idx - 1) * (len(holdLabels) + 1) + 1][0] = label
-	outputStyle[(len(costThresholds) - idx - 1) * (len(holdLabels) + 1) + 1][0] = Fore.GREEN
+		for hidx, hlabel in enumerate(holdLabels):
+			outputTable[idx * (len(holdLabels) + 1) + len(holdLabels) - hidx][1] = hlabel
+			outputStyle[idx * (len(holdLabels) + 1) + len(holdLabels) - hidx][1] = Fore.BLUE
 
-	for hidx, hlabel in enumerate(holdLabels):
-		outputTable[idx * (len(holdLabels) + 1) + len(holdLabels) - hidx][1] = hlabel
-		outputStyle[idx * (len(holdLabels) + 1) + len(holdLabels) - hidx][1] = Fore.BLUE
+	# Add the Bottles
+	for b in range(0, len(boldnessThresholds)):
+		for c in range(0, len(costThresholds)):
+			for h in range(0, len(holdLabels)):
+				rowCoord = (len(costThresholds) - c - 1) * (len(holdLabels) + 1) + len(holdLabels) - h
+				colCoord = b + 2
 
-# Add the Bottles
-for b in range(0, len(boldnessThresholds)):
-	for c in range(0, len(costThresholds)):
-		for h in range(0, len(holdLabels)):
+				outputTable[rowCoord][colCoord] = "        --------"
+
+	for bottle in layout.bottles:
+		coord = bottle.coordinate
+		if coord is not None:
+			(b, c, h) = coord
 			rowCoord = (len(costThresholds) - c - 1) * (len(holdLabels) + 1) + len(holdLabels) - h
 			colCoord = b + 2
 
-			outputTable[rowCoord][colCoord] = "        --------"
+			outputTable[rowCoord][colCoord] = bottle.label.description
 
-for bottle in layout.bottles:
-	coord = bottle.coordinate
-	if coord is not None:
-		(b, c, h) = coord
-		rowCoord = (len(costThresholds) - c - 1) * (len(holdLabels) + 1) + len(holdLabels) - h
-		colCoord = b + 2
+	# ----------------------------------------
+	# Print the table
 
-		outputTable[rowCoord][colCoord] = bottle.label.description
+	widths = []
+	for c in range(0, cols):
+		lengths = [ len(outputTable[r][c]) for r in range(0, rows) ]
+		widths.append(max(lengths))
 
-# ----------------------------------------
-# Print the table
+	def printCell(r, c):
+		print(" %s|%s %s%-*s%s" % (
+			    Fore.BLUE, Style.RESET_ALL,
+			    outputStyle[r][c], widths[c], outputTable[r][c], Style.RESET_ALL),
+		      end='')
 
-widths = []
-for c in range(0, cols):
-	lengths = [ len(outputTable[r][c]) for r in range(0, rows) ]
-	widths.append(max(lengths))
+	def printSomeColumns(colRange):
+		for r in range(0, rows):
+			printCell(r, 0)
+			printCell(r, 1)
 
-def printCell(r, c):
-	print(" %s|%s %s%-*s%s" % (
-		    Fore.BLUE, Style.RESET_ALL,
-		    outputStyle[r][c], widths[c], outputTable[r][c], Style.RESET_ALL),
-	      end='')
+			for c in colRange:
+				printCell(r, c)
 
-def printSomeColumns(colRange):
-	for r in range(0, rows):
-		printCell(r, 0)
-		printCell(r, 1)
+			print()
 
-		for c in colRange:
-			printCell(r, c)
+	colStart = 2
+	colEnd = 2
+	lineWidth = int(os.popen('stty size', 'r').read().split()[1])
+	availableWidth = lineWidth - sum(widths[0:2]) - (2 * 3)
 
-		print()
+	while colStart < cols:
+		while colEnd < cols - 1 and (sum(widths[colStart:colEnd + 2]) + (colEnd - colStart + 2) * 3) < availableWidth:
+			colEnd += 1
 
-colStart = 2
-colEnd = 2
-lineWidth = int(os.popen('stty size', 'r').read().split()[1])
-availableWidth = lineWidth - sum(widths[0:2]) - (2 * 3)
+		if (colStart > 2):
+			print()
+			print(Fore.BLUE, '-' * (lineWidth - 2), Style.RESET_ALL)
+			print()
 
-while colStart < cols:
-	while colEnd < cols - 1 and (sum(widths[colStart:colEnd + 2]) + (colEnd - colStart + 2) * 3) < availableWidth:
-		colEnd += 1
+		printSomeColumns(range(colStart, colEnd + 1))
 
-	if (colStart > 2):
-		print()
-		print(Fore.BLUE, '-' * (lineWidth - 2), Style.RESET_ALL)
-		print()
+		colStart = colEnd + 1
+		colEnd = colStart
 
-	printSomeColumns(range(colStart, colEnd + 1))
+# ----------------------------------------
+
+for idx, (name, layout) in enumerate(cellarLayout.layouts.items()):
+	if cellarLayout.geometry.multipleRacks:
+		if idx > 0: print()
+		print(Style.BRIGHT + Fore.GREEN + '======== Rack %s ========' % name + Style.RESET_ALL)
+		print()
 
-	colStart = colEnd + 1
-	colEnd = colStart
+	printRack(layout)
@@ -0,0 +1,24 @@
+#!/usr/bin/env python3
+
+# The tests share a single, temporary database, created from data/schema.sql
+# and migrated to the current version. The backend is bound to its database
+# when it is first imported, so every test module imports this before anything
+# from backend.
+
+# --------------------------------------------------------------------------------
+
+import os
+import sqlite3
+import tempfile
+
+DatabaseDir = tempfile.TemporaryDirectory()
+DatabasePath = os.path.join(DatabaseDir.name, 'cellar.db')
+
+with open(os.path.join(os.path.dirname(__file__), '..', 'data', 'schema.sql')) as f:
+	sqlite3.connect(DatabasePath).executescript(f.read())
+
+os.environ['CELLAR_DATA'] = 'sqlite:///' + DatabasePath
+
+from backend.raw.schema import migrate
+
+migrate()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+# These check that the label aggregates kept current by the triggers (and by
+# the flush, for the values) always match those computed from scratch by
+# rebuildAggregates, and that bottles can be written without SQLAlchemy.
+
+# --------------------------------------------------------------------------------
+
+import sqlite3
+import unittest
+
+from datetime import date
+
+from cellarDatabase import DatabasePath
+
+from backend.raw import db
+from backend.raw.data_model import Label, Bottle
+from backend.raw.schema import rebuildAggregates
+from backend.repository import Repository
+
+# --------------------------------------------------------------------------------
+
+class LabelAggregateTests(unittest.TestCase):
+	def setUp(self):
+		"""Start every test with a fresh session, on a cellar of two labels"""
+
+		db.session.remove()
+		repo = Repository()
+
+		region = repo.addRegion('Napa', 'USA')
+		winery = repo.addWinery('Winery %d' % id(self), region)
+		cabernet = repo.addVarietal('Cabernet %d' % id(self), 60)
+		merlot = repo.addVarietal('Merlot %d' % id(self), 45)
+
+		self.labels = [repo.addLabel('Reserve', 2015, 14.5, winery, [(cabernet, 100)]),
+		               repo.addLabel('Blend', 2018, 13.5, winery, [(cabernet, 60), (merlot, 40)])]
+
+		self.bottles = [repo.addBottle(cost, date(2016 + idx, 3, 1), 2025, self.labels[idx % 2])
+		                for idx, cost in enumerate([20.0, 35.5, 42.0, 18.25, 60.0])]
+
+		db.session.commit()
+
+	def assertAggregatesCurrent(self, columns=Label._aggregates):
+		"""Checks the stored aggregates against a rebuild from scratch"""
+
+		def aggregates():
+			with db.engine.connect() as connection:
+				return connection.exec_driver_sql('SELECT id, %s FROM labels ORDER BY id' % ', '.join(columns)).all()
+
+		stored = aggregates()
+		rebuildAggregates()
+
+		for storedRow, rebuiltRow in zip(stored, aggregates()):
+			for storedValue, rebuiltValue in zip(storedRow, rebuiltRow):
+				self.assertAlmostEqual(storedValue, rebuiltValue)
+
+	# ----------------------------------------
+
+	def testInsert(self):
+		self.assertAggregatesCurrent()
+
+		Repository().addBottle(99.0, date(2020, 6, 1), 2030, self.labels[0])
+		db.session.commit()
+		self.assertAggregatesCurrent()
+
+	def testUpdate(self):
+		self.bottles[0].cost = 120.0
+		self.bottles[1].acquisition = date(2012, 1, 1)
+		self.bottles[2].consumption = date(2022, 12, 25)
+		self.bottles[3].label = self.labels[0]
+		db.session.commit()
+		self.assertAggregatesCurrent()
+
+	def testDelete(self):
+		db.session.delete(self.bottles[4])
+		db.session.commit()
+		self.assertAggregatesCurrent()
+
+	def testBlendChanges(self):
+		self.labels[1].blends[0].portion = 75
+		self.labels[1].blends[1].portion = 25
+		self.labels[1].blends[0].varietal.boldness = 65
+		db.session.commit()
+		self.assertAggregatesCurrent()
+
+	def testWritesWithoutSqlAlchemy(self):
+		"""Bottles written by another tool (without the inflated_cost function)
+		keep their label counts current. Their values are only current after a
+		rebuild.
+		"""
+
+		labelId = self.labels[0].id
+		bottleIds = [bottle.id for bottle in self.bottles]
+		db.session.remove()
+
+		connection = sqlite3.connect(DatabasePath)
+		with connection:
+			connection.execute("INSERT INTO bottles (cost, acquisition, hold_until, label_id) VALUES (15.0, '2021-01-01', 2024, ?)",
+			                   (labelId,))
+			connection.execute("UPDATE bottles SET consumption = '2023-02-14' WHERE id = ?", (bottleIds[0],))
+			connection.execute("DELETE FROM bottles WHERE id = ?", (bottleIds[1],))
+
+		connection.close()
+		self.assertAggregatesCurrent(['weighted_boldness', 'num_stored', 'num_consumed'])
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+
+# These lay out small, made-up cellars of transient model objects (never added
+# to the session). Costs, acquisition dates and hold years are fixed, so the
+# layouts do not depend on the current date.
+
+# --------------------------------------------------------------------------------
+
+import random
+import unittest
+
+from collections import Counter
+
+from datetime import date
+
+import cellarDatabase
+
+from backend.raw.data_model import Region, Winery, Label, Bottle
+from backend.cellarGeometry import CellarGeometry, RackGeometry, DefaultRack, cellarGeometry
+from backend.cellarLayout import CellarLayout
+from backend.dividoLayout import DividoLayout
+from backend.defragPlanner import DefragPlanner
+from backend.databaseLogger import NullLogger
+
+# Hold years that are always past (drink now) or to come (hold)
+PastHoldYear = 2000
+FutureHoldYear = 2100
+
+def makeBottles(numLabels, drinkShare, seed=1):
+	"""This makes up a cellar of unpositioned bottles, of the supplied number
+	of labels. Each label has a boldness between 20 and 70, and one to six
+	bottles bought together, so some bottles are interchangeable. The supplied
+	share of the labels are ready to drink.
+	"""
+
+	rng = random.Random(seed)
+	regions = [Region(id=1, name='Napa', country='USA'), Region(id=2, name='Rioja', country='Spain')]
+	wineries = [Winery(id=idx + 1, name='Winery %d' % (idx + 1), region=regions[idx % 2]) for idx in range(0, 6)]
+
+	bottles = []
+	for idx in range(0, numLabels):
+		label = Label(id=idx + 1, name='Label %d' % (idx + 1), vintage=2010 + idx % 8, winery=wineries[idx % 6],
+		              weighted_boldness=float(rng.randint(20, 70)))
+
+		cost = round(rng.uniform(10, 120), 2)
+		acquisition = date(rng.randint(2015, 2022), rng.randint(1, 12), 1)
+		holdUntil = PastHoldYear if rng.random() < drinkShare else FutureHoldYear
+
+		for purchase in range(0, rng.choice([1, 1, 2, 3, 6])):
+			bottles.append(Bottle(id=len(bottles) + 1, label=label, label_id=label.id, cost=cost,
+			                      acquisition=acquisition, hold_until=holdUntil))
+
+	return bottles
+
+# --------------------------------------------------------------------------------
+
+# The positions given to makeBottles(40, 0.75, seed=3) in the DefaultRack, by
+# bottle id, as computed by the original layout algorithm (which scanned every
+# positioned bottle for each slot). Two drink now stacks overflow.
+ExpectedPositions = [
+	(8, 6, 2), (8, 6, 1), (8, 7, 2), (1, 2, 0), (9, 10, 2), (9, 11, 2), (9, 11, 1), (4, 5, 0),
+	(4, 6, 0), (4, 7, 0), (4, 8, 0), (4, 9, 0), (4, 10, 0), (6, 6, 2), (5, 6, 2), (6, 6, 1),
+	(5, 6, 1), (6, 7, 2), (5, 7, 2), (10, 1, 0), (10, 2, 0), (10, 3, 0), (0, 6, 0), (0, 7, 0),
+	(0, 8, 0), (0, 9, 0), (0, 10, 0), (0, 11, 0), (4, 11, 0), (4, 0, 2), (4, 0, 1), (4, 1, 2),
+	(3, 6, 0), (3, 7, 0), (3, 8, 0), (3, 9, 0), (3, 10, 0), (3, 11, 0), (8, 10, 2), (1, 6, 0),
+	(1, 7, 0), (1, 8, 0), (1, 9, 0), (1, 10, 0), (1, 11, 0), (8, 1, 2), (8, 1, 1), (8, 2, 2),
+	(10, 1, 2), (8, 3, 0), (8, 4, 0), (8, 5, 0), (8, 6, 0), (8, 7, 0), (8, 8, 0), (0, 0, 2),
+	(0, 0, 1), (4, 0, 0), (2, 5, 0), (2, 6, 0), (9, 6, 0), (6, 2, 2), (5, 2, 2), (6, 2, 1),
+	(5, 2, 1), (6, 3, 2), (5, 3, 2), (10, 5, 0), (7, 3, 0), (7, 4, 0), (11, 0, 0), (11, 1, 0),
+	(11, 2, 0), (11, 3, 0), (11, 4, 0), (11, 5, 0), (1, 0, 0), (1, 1, 0), (2, 7, 0), (6, 0, 0),
+	(5, 0, 0), (9, 2, 2), (9, 2, 1), (7, 8, 2), (7, 5, 0), (7, 6, 0), (7, 7, 0), (1, 3, 0),
+	(1, 4, 0), (1, 5, 0), (2, 4, 0), (6, 8, 0), (2, 1, 0), (2, 2, 0), (4, 1, 0), (4, 2, 0),
+	(4, 3, 0), (11, 6, 0), (11, 7, 0), (11, 8, 0), (11, 9, 0), (11, 10, 0), (11, 11, 0), (3, 0, 0),
+	(3, 1, 0), (3, 2, 0), (3, 3, 0), (3, 4, 0), (3, 5, 0), (8, 5, 2), (8, 5, 1), (10, 8, 2),
+	(10, 8, 1), (10, 9, 2), (10, 9, 1), (10, 10, 2), (10, 10, 1), (9, 9, 0), (9, 10, 0), (9, 11, 0)
+]
+
+class DividoLayoutTests(unittest.TestCase):
+	def testPositions(self):
+		"""The positions are those of the original algorithm"""
+
+		bottles = makeBottles(40, 0.75, seed=3)
+		layout = DividoLayout(bottles, rack=DefaultRack)
+		layout.positionBottles(NullLogger())
+
+		self.assertEqual([bottle.coordinate for bottle in bottles], ExpectedPositions)
+
+	def testBins(self):
+		"""The bins are those of the original algorithm, for clustered data,
+		data with a few outliers, and fewer points than bins
+		"""
+
+		inf = float('inf')
+		clustered = [45.0] * 30 + [20.0 + (idx * 7) % 50 for idx in range(0, 50)]
+		outliers = [10.0 + (idx * 13) % 50 + idx / 100 for idx in range(0, 60)] + [850.0, 1200.0, 4000.0]
+		few = [30.0, 55.5, 62.0]
+
+		self.assertEqual(DividoLayout._createBins(clustered, 12, True),
+		                 [(26, 1), (32, 1), (38, 1), (44, 1), (46, 5), (50, 1), (56, 1), (inf, 1)])
+		self.assertEqual(DividoLayout._createBins(clustered, 12, False),
+		                 [(26, 1), (32, 1), (38, 1), (44, 1), (46, 1), (47, 1), (48, 1), (49, 1), (50, 1), (51, 1), (56, 1), (inf, 1)])
+		self.assertEqual(DividoLayout._createBins(outliers, 12, False),
+		                 [(13, 1), (17, 1), (22, 1), (26, 1), (29, 1), (34, 1), (38, 1), (42, 1), (47, 1), (51, 1), (55, 1), (inf, 1)])
+		self.assertEqual(DividoLayout._createBins(few, 12, True), [(30, 11), (inf, 1)])
+		self.assertEqual(DividoLayout._createBins(few, 12, False),
+		                 [(30, 1), (31, 1), (32, 1), (33, 1), (34, 1), (35, 1), (36, 1), (37, 1), (38, 1), (39, 1), (40, 1), (inf, 1)])
+
+	def testFindBins(self):
+		"""Each value is in the first bin whose threshold is above it, as with a
+		linear scan of the bins
+		"""
+
+		bins = DividoLayout._createBins([45.0] * 30 + [20.0 + (idx * 7) % 50 for idx in range(0, 50)], 12, True)
+		values = [0.0, 1e9] + [threshold + offset for threshold, width in bins[:-1] for offset in (-0.01, 0, 0.5)]
+
+		expected = [next((idx for idx, (threshold, width) in enumerate(bins[:-1]) if value < threshold), len(bins) - 1)
+		            for value in values]
+		layout = DividoLayout([], (bins, bins), DefaultRack)
+		self.assertEqual(layout._findBins(values, bins).tolist(), expected)
+
+	def testOrderIndependent(self):
+		"""Interchangeable bottles are told apart by id, so the positions do
+		not depend on the order the bottles are supplied in
+		"""
+
+		bottles = makeBottles(40, 0.75, seed=3)
+		layout = DividoLayout(list(reversed(bottles)), rack=DefaultRack)
+		layout.positionBottles(NullLogger())
+
+		self.assertEqual([bottle.coordinate for bottle in bottles], ExpectedPositions)
+
+	def testOverflowPlan(self):
+		"""The overflow plan moves bottles out of overfull stacks, through
+		their neighbors, so that the net flows leave every stack within its
+		capacity. Bolder bottles never end up in a lighter stack than lighter
+		bottles of the same hold band.
+		"""
+
+		for seed in range(1, 6):
+			bottles = makeBottles(40, 0.95, seed)
+			layout = DividoLayout(bottles, rack=DefaultRack)
+			initialBins = layout._findBins([bottle.label.weightedBoldness for bottle in bottles], layout.boldBins).tolist()
+			layout.positionBottles(NullLogger())
+
+			for holdBin in [0, 1]:
+				counts = [0] * len(layout.boldBins)
+				for bottle, boldBin in zip(bottles, initialBins):
+					if (bottle.hold_until > PastHoldYear) == (holdBin == 1):
+						counts[boldBin] += 1
+
+				for transfer in layout.overflowPlan.transfers:
+					if transfer.holdBin == holdBin:
+						self.assertEqual(abs(transfer.toBin - transfer.fromBin), 1)
+						counts[transfer.fromBin] -= transfer.count
+						counts[transfer.toBin] += transfer.count
+
+				boldnessByBin = [[] for boldBin in layout.boldBins]
+				for bottle in bottles:
+					if (bottle.hold_coord > 0) == (holdBin == 1):
+						boldnessByBin[layout._boldnessBinIdx(bottle.boldness_coord)].append(bottle.label.weightedBoldness)
+
+				for boldBin, stacks in enumerate(layout.stacks):
+					stack = stacks[holdBin]
+					self.assertEqual(counts[boldBin], len(boldnessByBin[boldBin]))
+					self.assertLessEqual(counts[boldBin], stack.width * stack.depth * DefaultRack.costLevels)
+
+				filled = [boldness for boldness in boldnessByBin if len(boldness) > 0]
+				for lighter, bolder in zip(filled, filled[1:]):
+					self.assertLessEqual(max(lighter), min(bolder))
+
+	def testOverflowMoves(self):
+		"""The overflow of a stack is moved to its nearest neighbor with room,
+		cascading through full neighbors
+		"""
+
+		bottles = makeBottles(40, 0.75, seed=3)
+		layout = DividoLayout(bottles, rack=DefaultRack)
+		layout.positionBottles(NullLogger())
+
+		plan = layout.overflowPlan
+		self.assertEqual([(stack.holdBin, stack.boldBin, stack.excess) for stack in plan.overfull], [(0, 0, 3), (0, 7, 1)])
+		self.assertEqual([(transfer.holdBin, transfer.fromBin, transfer.toBin, transfer.count) for transfer in plan.transfers],
+		                 [(0, 0, 1, 3), (0, 7, 6, 1)])
+		self.assertEqual(plan.bottleSteps, 4)
+
+		bottles = makeBottles(40, 0.95, seed=1)
+		layout = DividoLayout(bottles, rack=DefaultRack)
+		layout.positionBottles(NullLogger())
+
+		plan = layout.overflowPlan
+		self.assertEqual([(stack.holdBin, stack.boldBin, stack.excess) for stack in plan.overfull], [(0, 10, 8)])
+		self.assertEqual([(transfer.holdBin, transfer.fromBin, transfer.toBin, transfer.count) for transfer in plan.transfers],
+		                 [(0, 10, 9, 8), (0, 9, 8, 2)])
+		self.assertEqual(plan.bottleSteps, 10)
+
+class CellarLayoutTests(unittest.TestCase):
+	def testEmptyRack(self):
+		"""A rack whose rule matches none of the bottles is laid out empty,
+		while the other racks are laid out as usual (here in parallel, as two
+		of them have bottles).
+		"""
+
+		bottles = makeBottles(30, 0.5)
+		geometry = CellarGeometry([RackGeometry('light', 4, 6, 3, {'maxBoldness': 10}),
+		                           RackGeometry('bold', 6, 12, 3, {'minBoldness': 50}),
+		                           RackGeometry('main', 12, 12, 3)])
+
+		layout = CellarLayout(bottles, geometry)
+		layout.positionBottles(NullLogger())
+
+		self.assertEqual(layout.bottlesByRack['light'], [])
+		self.assertEqual(layout.layouts['light'].boldBins, [(float('inf'), 4)])
+		self.assertEqual(len(layout.layouts['light'].costBins), 6)
+
+		for bottle in bottles:
+			self.assertIsNotNone(bottle.coordinate)
+			self.assertEqual(bottle.rack, 'bold' if bottle.label.weighted_boldness >= 50 else 'main')
+
+		# Laying out the positioned bottles again finds them all in their stacks
+		layout = CellarLayout(bottles, geometry)
+		self.assertEqual(sum(len(stack.positioned) for rackLayout in layout.layouts.values()
+		                     for stacks in rackLayout.stacks for stack in stacks), len(bottles))
+
+class DefragPlannerTests(unittest.TestCase):
+	def testMinimalDefragmentation(self):
+		"""After some bottles are consumed and others bought, the planned
+		positions are equivalent to the full re-layout: the same number of each
+		kind of bottle (label and hold year) in every stack and cost level. The
+		plan moves fewer bottles than the full re-layout would.
+		"""
+
+		bottles = makeBottles(40, 0.5, seed=1)
+		CellarLayout(bottles, cellarGeometry()).positionBottles(NullLogger())
+
+		bottles = [bottle for bottle in bottles if bottle.id % 5 != 0]
+		for label in [bottles[0].label, bottles[40].label, bottles[-1].label]:
+			for purchase in range(0, 3):
+				bottles.append(Bottle(id=1000 + len(bottles), label=label, label_id=label.id, cost=80.0,
+				                      acquisition=date(2022, 6, 1), hold_until=FutureHoldYear))
+
+		planner = DefragPlanner(bottles)
+		layout = planner.layout.layouts[cellarGeometry().racks[0].name]
+		stackOf = {(boldCoord, holdBin): boldBin for boldBin, stacks in enumerate(layout.stacks)
+		           for holdBin, stack in enumerate(stacks) for boldCoord in stack.boldnessCoords}
+
+		def groups(positions):
+			"""Counts the bottles of each kind in each stack and cost level"""
+			return Counter((stackOf[(coordinate[0], 0 if coordinate[2] == 0 else 1)], coordinate[1],
+			                bottle.label_id, bottle.hold_until)
+			               for bottle, (rack, coordinate) in positions.items())
+
+		self.assertEqual(groups(planner.planned), groups(planner.target))
+		self.assertEqual(len(set(planner.planned.values())), len(bottles))
+		self.assertEqual((planner.moves, planner.fullMoves), (53, 77))
+
+		planner.apply(NullLogger())
+		self.assertEqual({bottle: (bottle.rack, bottle.coordinate) for bottle in bottles}, planner.planned)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+
+# These check the web service's response cache (see ResponseCache) through
+# Flask's test client, on endpoints registered here in the style of
+# wine-service.fcgi: conditional requests, the gzip representation, and
+# invalidation through the data change counter, including writes made without
+# SQLAlchemy.
+
+# --------------------------------------------------------------------------------
+
+import gzip
+import json
+import sqlite3
+import unittest
+
+from datetime import date
+
+from cellarDatabase import DatabasePath
+
+from flask import abort
+
+from backend.raw import app, db
+from backend.raw.data_model import Winery
+from backend.raw.schema import dataChanges
+from backend.repository import Repository
+from backend.responseCache import ResponseCache, jsonResponse
+
+responses = ResponseCache()
+
+@app.route('/test/wineries')
+@responses.cached
+def wineries():
+	"""This returns the names of every winery"""
+	return jsonResponse(sorted(winery.name for winery in db.session.query(Winery)))
+
+@app.route('/test/wineries/<name>')
+@responses.cached
+def winery(name):
+	"""This returns a single winery by name"""
+
+	winery = db.session.query(Winery).filter(Winery.name == name).one_or_none()
+	if winery is None:
+		abort(404)
+
+	return jsonResponse(winery.value)
+
+# --------------------------------------------------------------------------------
+
+class ResponseCacheTests(unittest.TestCase):
+	def setUp(self):
+		"""Start every test with a fresh session, and a winery to find"""
+
+		db.session.remove()
+		repo = Repository()
+		repo.addWinery('Cached %d' % id(self), repo.addRegion('Cached %d' % id(self), 'USA'))
+		db.session.commit()
+
+		self.client = app.test_client()
+
+	def addWinery(self):
+		"""Changes the data, through the ORM"""
+
+		repo = Repository()
+		repo.addWinery('Added %d' % id(self), repo.addRegion('Added %d' % id(self), 'France'))
+		db.session.commit()
+
+	# ----------------------------------------
+
+	def testNotModified(self):
+		response = self.client.get('/test/wineries')
+		self.assertEqual(response.status_code, 200)
+		self.assertIn('Cached %d' % id(self), json.loads(response.data))
+
+		etag = response.headers['ETag']
+		self.assertIsNotNone(response.headers.get('Last-Modified'))
+
+		response = self.client.get('/test/wineries', headers={'If-None-Match': etag})
+		self.assertEqual(response.status_code, 304)
+		self.assertEqual(response.headers['ETag'], etag)
+		self.assertEqual(response.data, b'')
+
+	def testModifiedSinceAlone(self):
+		"""The change time only has a resolution of a second, so it is not
+		enough for a 304 on its own
+		"""
+
+		response = self.client.get('/test/wineries')
+		response = self.client.get('/test/wineries', headers={'If-Modified-Since': response.headers['Last-Modified']})
+		self.assertEqual(response.status_code, 200)
+
+	def testErrorsNotCached(self):
+		"""A path that does not answer 200 is never Not Modified, even though
+		the ETag names the current data version
+		"""
+
+		etag = self.client.get('/test/wineries').headers['ETag']
+
+		for attempt in range(0, 2):
+			response = self.client.get('/test/wineries/Nope', headers={'If-None-Match': etag})
+			self.assertEqual(response.status_code, 404)
+
+		response = self.client.get('/test/wineries/Cached %d' % id(self), headers={'If-None-Match': etag})
+		self.assertEqual(response.status_code, 304)
+
+	def testGzip(self):
+		plain = self.client.get('/test/wineries')
+		response = self.client.get('/test/wineries', headers={'Accept-Encoding': 'gzip'})
+
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+		self.assertEqual(response.headers['ETag'], plain.headers['ETag'][:-1] + '-gzip"')
+		self.assertIn('Accept-Encoding', response.headers['Vary'])
+		self.assertEqual(gzip.decompress(response.data), plain.data)
+
+		etag = response.headers['ETag']
+		response = self.client.get('/test/wineries', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+		self.assertEqual(response.status_code, 304)
+
+		response = self.client.get('/test/wineries', headers={'If-None-Match': etag})
+		self.assertEqual(response.status_code, 200)
+
+	def testWritesInvalidate(self):
+		"""A write changes the data version, and so the ETag and the body"""
+
+		response = self.client.get('/test/wineries')
+		etag = response.headers['ETag']
+
+		self.addWinery()
+
+		response = self.client.get('/test/wineries', headers={'If-None-Match': etag})
+		self.assertEqual(response.status_code, 200)
+		self.assertNotEqual(response.headers['ETag'], etag)
+		self.assertIn('Added %d' % id(self), json.loads(response.data))
+
+	def testChangeCounter(self):
+		"""Every insert, update and delete counts as a change, whether made
+		through the ORM or by another tool (here plain sqlite3, as the sqlite3
+		shell would). Reads do not.
+		"""
+
+		count, changedAt = dataChanges()
+		etag = self.client.get('/test/wineries').headers['ETag']
+		self.assertEqual(dataChanges()[0], count)
+
+		connection = sqlite3.connect(DatabasePath)
+		statements = ["INSERT INTO regions (name, country) VALUES ('Shell', 'Chile')",
+		              "UPDATE regions SET name = 'Shell Valley' WHERE name = 'Shell'",
+		              "DELETE FROM regions WHERE name = 'Shell Valley'"]
+
+		for statement in statements:
+			with connection:
+				connection.execute(statement)
+
+			self.assertEqual(dataChanges()[0], count + 1)
+			count = dataChanges()[0]
+
+		connection.close()
+
+		response = self.client.get('/test/wineries', headers={'If-None-Match': etag})
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response.headers['ETag'], '"%d-%d"' % (count, date.today().year))
+		self.assertGreaterEqual(dataChanges()[1], changedAt)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+# These check that the reports computed from a CellarSnapshot are the same as
+# those computed from the database, on a cellar with bottles in several
+# regions and hold years, some of them consumed.
+
+# --------------------------------------------------------------------------------
+
+import unittest
+
+from datetime import date, timedelta
+
+import cellarDatabase
+
+from backend.raw import db
+from backend.raw.table_base import TableBase
+from backend.repository import Repository
+from backend.cellar import Cellar, SnapshotBottles
+from backend.cellarSnapshot import CellarSnapshot
+
+import numpy
+
+def comparable(value):
+	"""This converts a report into plain values that can be compared: model
+	objects become their class and id, groups of bottles become lists, and
+	numbers are rounded past any difference in summation order.
+	"""
+
+	if isinstance(value, TableBase):
+		return (type(value).__name__, value.id)
+
+	if isinstance(value, dict):
+		return {comparable(key): comparable(item) for key, item in value.items()}
+
+	if isinstance(value, (list, tuple, SnapshotBottles, numpy.ndarray)):
+		return [comparable(item) for item in value]
+
+	if isinstance(value, (float, numpy.floating)):
+		return round(float(value), 6)
+
+	if isinstance(value, numpy.integer):
+		return int(value)
+
+	return value
+
+# --------------------------------------------------------------------------------
+
+class SnapshotTests(unittest.TestCase):
+	@classmethod
+	def setUpClass(cls):
+		"""Fill the cellar: every label gets bottles bought over the last few
+		years, held for up to six years, with the oldest bottles consumed on
+		days spread over the year (including the first and last days).
+		"""
+
+		db.session.remove()
+		repo = Repository()
+		today = date.today()
+
+		regions = [repo.addRegion('Snapshot %d' % idx, country) for idx, country in enumerate(['USA', 'USA', 'France'])]
+		varietals = [repo.addVarietal('Snapshot %d' % idx, boldness) for idx, boldness in enumerate([20, 45, 60, 72])]
+
+		for idx in range(0, 12):
+			winery = repo.addWinery('Snapshot %d' % idx, regions[idx % 3])
+			blends = [(varietals[idx % 4], 100)] if idx % 3 else [(varietals[idx % 4], 70), (varietals[(idx + 1) % 4], 30)]
+			label = repo.addLabel('Snapshot', 2008 + idx, 14.0, winery, blends)
+
+			for n in range(0, 2 + idx % 4):
+				bottle = repo.addBottle(15.0 + idx * 4.5 + n, date(2014 + (idx + n) % 9, 1 + (idx * n) % 12, 1),
+				                        today.year - 2 + (idx + n) % 8, label)
+				if n == 0:
+					bottle.consumption = date(today.year - 1 - idx % 3, 1, 1) + timedelta(days=idx * 33 % 365)
+
+		db.session.commit()
+
+	def assertReportsEqual(self, report):
+		"""Checks a report method gives the same result from both sources"""
+
+		self.assertEqual(comparable(report(Cellar())), comparable(report(Cellar(CellarSnapshot()))))
+
+	# ----------------------------------------
+
+	def testBottlesByYear(self):
+		self.assertReportsEqual(lambda cellar: cellar.bottlesByYear)
+
+	def testByRegion(self):
+		self.assertReportsEqual(lambda cellar: cellar.byRegion())
+		self.assertReportsEqual(lambda cellar: cellar.byRegion(withBottles=True))
+
+	def testByVarietal(self):
+		self.assertReportsEqual(lambda cellar: cellar.byVarietal())
+
+	def testConsumptionProjection(self):
+		self.assertReportsEqual(lambda cellar: cellar.consumptionProjection())
+		self.assertReportsEqual(lambda cellar: cellar._monthlyConsumptionHistory())
+
+if __name__ == '__main__':
+	unittest.main()
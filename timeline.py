@@ -9,12 +9,17 @@ from colorama import Fore, Back, Style
 from datetime import date
 
 from backend.cellar import Cellar
+from backend.cellarSnapshot import CellarSnapshot
 from scripts.styling import stylize
 from scripts.options import parseArguments
 
-[showCosts] = parseArguments([('c', 'cost', 'Also show total inventory value')])
-cellar = Cellar()
-projection = cellar.consumptionProjection();
+[showCosts, simulations] = parseArguments([
+	('c', 'cost', 'Also show total inventory value'),
+	('s', 'simulate', 'count', 'Show excess / shortfall ranges from this many simulated consumption trajectories')
+])
+
+cellar = Cellar(CellarSnapshot())
+projection = cellar.consumptionProjection(int(simulations) if simulations else None);
 
 currentYear = date.today().year
 
@@ -48,7 +53,14 @@ for holdYear in projection['byYear']:
 	else:
 		excessText = '%2d Short' % -excess
 
-	print('%s: %s (%s)' % (
+	simulatedText = ''
+	if 'simulated' in projection['byYear'][holdYear]:
+		simulated = projection['byYear'][holdYear]['simulated']
+		bands = list(simulated['excess'].values())
+		simulatedText = '  ' + stylize(Style.DIM, '[%s .. %s .. %s, %2d%% short]' % (
+			'%+d' % bands[0], '%+d' % bands[1], '%+d' % bands[-1], round(simulated['shortfallChance'] * 100)))
+
+	print('%s: %s (%s)%s' % (
 		stylize(Style.BRIGHT, str(holdYear)),
 		stylize(Fore.GREEN, '%2d bottle%s' % (count, ' ' if count == 1 else 's')),
-		excessText))
+		excessText, simulatedText))